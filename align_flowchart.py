@@ -1,557 +1,2896 @@
 import re
 import sys
 import os
+import bisect
+import filecmp
+import fnmatch
+import functools
+import glob
+import io
+import hashlib
+import itertools
+import json
+import collections
+import mmap
+import operator
+import socketserver
+import tempfile
+import threading
+import time
 import unicodedata
 
 import argparse
-parser = argparse.ArgumentParser(description="对齐流程图中的竖线")
-parser.add_argument("--input", "-i", type=str, default=r"C:\Users\wanglb\Desktop\new 11.txt",
-                    help="输入文件路径（使用 '-' 或留空表示从标准输入读取）")
-parser.add_argument("--output", "-o", type=str, default=None,
-                    help="输出文件路径（默认: 输出到标准输出）")
-parser.add_argument("--debug", action="store_true", help="显示调试信息")
-args = parser.parse_args()
-
-# 从文件或标准输入读取输入
-if args.input is None or args.input == '-':
-    # 从标准输入读取
-    if args.debug:
-        print("从标准输入读取...", file=sys.stderr)
-    try:
-        text_raw = sys.stdin.read()
-    except Exception as e:
-        print(f"错误: 无法从标准输入读取: {e}", file=sys.stderr)
-        sys.exit(1)
-else:
-    # 从文件读取
-    input_file = args.input
-    if not os.path.exists(input_file):
-        print(f"错误: 文件不存在: {input_file}", file=sys.stderr)
-        sys.exit(1)
-    
-    try:
-        with open(input_file, 'r', encoding='utf-8', errors='replace') as f:
-            text_raw = f.read()
-    except Exception as e:
-        print(f"错误: 无法读取文件 {input_file}: {e}", file=sys.stderr)
-        sys.exit(1)
+import concurrent.futures
+import contextlib
+import difflib
 
-lines = text_raw.splitlines()
+numpy = None  # 可选依赖，使用 NumPy 后端时才由 load_numpy 导入
 
-if args.debug:
-    print("====== RAW INPUT ======")
-    print(text_raw)
-    print("========================\n")
+# 默认查找范围：竖线向上8行、左右5列；下角标字符"┘"向上10行、左右3列
+DEFAULT_ROW_RANGE = 8
+DEFAULT_COL_RANGE = 5
+DEFAULT_CORNER_ROW_RANGE = 10
+DEFAULT_CORNER_COL_RANGE = 3
+DEFAULT_MAX_ITERATIONS = 10  # 最大迭代次数，防止无限循环
+PAIRED_CORNER_SEARCH_RANGE = 10  # 在 top_line 下方多少行内查找配对的 bottom_line
+ALIGN_MODES = ('iterative', 'solve', 'box')
+TARGET_BACKENDS = ('auto', 'python', 'numpy')
+NUMPY_MIN_CHARS = 20000  # auto 时区域的字符数达到此值才使用 NumPy 查找目标位置
 
 
 # ---------------------------------------
 # Step 1: 查找所有含文字和竖线的行，记录所有竖线的位置
 # ---------------------------------------
+# 补充的全角范围（east_asian_width 之外），按起点排序，供二分查找
+# (起点, 终点) 均为闭区间
+_EXTRA_WIDE_RANGES = (
+    (0x3000, 0x303F),  # CJK符号和标点
+    (0x3040, 0x309F),  # 平假名
+    (0x30A0, 0x30FF),  # 片假名
+    (0x3400, 0x4DBF),  # CJK扩展A
+    (0x4E00, 0x9FFF),  # CJK统一汉字
+    (0xFF00, 0xFFEF),  # 全角字符块
+)
+_EXTRA_WIDE_STARTS = tuple(start for start, _ in _EXTRA_WIDE_RANGES)
+
+def _classify_width(char):
+    """按 east_asian_width 和补充范围表计算单个字符的显示宽度（1 或 2）"""
+    # 使用 unicodedata 的 east_asian_width 属性判断
+    # 'W' (Wide) 和 'F' (Fullwidth) 表示占两个位置
+    if unicodedata.east_asian_width(char) in ('W', 'F'):
+        return 2
+    # 补充一些特殊情况：CJK符号和标点等
+    code = ord(char)
+    i = bisect.bisect_right(_EXTRA_WIDE_STARTS, code) - 1
+    if i >= 0 and code <= _EXTRA_WIDE_RANGES[i][1]:
+        return 2
+    return 1
+
+class _CharWidthMemo(dict):
+    """字符 → 显示宽度的缓存，未命中时分类一次并记住结果"""
+    def __missing__(self, char):
+        width = _classify_width(char)
+        self[char] = width
+        return width
+
+_CHAR_WIDTHS = _CharWidthMemo((chr(c), 1) for c in range(0x80))
+
+# 流程图中常见的半角非 ASCII 字符（箭头、框线、几何图形），整行只由这些字符和 ASCII 组成时无需逐字符分类
+_NARROW_SYMBOLS = "".join(chr(c) for c in range(0x2190, 0x2600) if _classify_width(chr(c)) == 1)
+_maybe_wide = re.compile("[^\x00-\x7f" + re.escape(_NARROW_SYMBOLS) + "]").search
+
+def char_width(char):
+    """返回单个字符的显示宽度（全角为 2，其余为 1）"""
+    return _CHAR_WIDTHS[char]
+
 def is_wide_char(char):
     """
     判断字符是否占两个字符位置（全角字符）
     包括：汉字、中文标点、全角字母数字符号等
     """
-    # 使用 unicodedata 的 east_asian_width 属性判断
-    # 'W' (Wide) 和 'F' (Fullwidth) 表示占两个位置
-    width = unicodedata.east_asian_width(char)
-    if width in ('W', 'F'):
-        return True
-    
-    # 补充一些特殊情况：CJK符号和标点等
-    code = ord(char)
-    if (
-        # CJK符号和标点
-        (0x3000 <= code <= 0x303F) or
-        # 平假名
-        (0x3040 <= code <= 0x309F) or
-        # 片假名
-        (0x30A0 <= code <= 0x30FF) or
-        # CJK统一汉字
-        (0x4E00 <= code <= 0x9FFF) or
-        # CJK扩展A
-        (0x3400 <= code <= 0x4DBF) or
-        # 全角字符块
-        (0xFF00 <= code <= 0xFFEF)
-    ):
-        return True
-    
-    return False
+    return _CHAR_WIDTHS[char] == 2
+
+def line_display_width(text):
+    """
+    计算整段文本的显示宽度
+    纯 ASCII 或只含框线/箭头的文本直接返回长度，其余文本在 C 层一次性累加字符宽度
+    """
+    if text.isascii() or not _maybe_wide(text):
+        return len(text)
+    return sum(map(_CHAR_WIDTHS.__getitem__, text))
 
 def count_wide_chars(text):
     """
     计算文本中占两个字符位置的字符数量
     """
-    return sum(1 for c in text if is_wide_char(c))
+    return line_display_width(text) - len(text)
+
+@functools.lru_cache(maxsize=16384)
+def build_column_index(line):
+    """
+    为一行建立显示位置索引（同一行内容只计算一次，之后所有查找复用）
+    返回: cols，长度为 len(line) + 1，cols[i] 为第 i 个字符的显示位置，
+          cols[len(line)] 为整行的显示宽度
+    """
+    if line.isascii() or not _maybe_wide(line):
+        return tuple(range(len(line) + 1))
+    return tuple(itertools.accumulate(map(_CHAR_WIDTHS.__getitem__, line), initial=0))
+
+def display_col_of(line, char_idx):
+    """返回第 char_idx 个字符的显示位置（等价于 char_idx + count_wide_chars(line[:char_idx])）"""
+    cols = build_column_index(line)
+    if char_idx < len(cols):
+        return cols[char_idx]
+    # 超出行尾时与切片语义一致：行尾之后的位置按半角计算
+    return cols[-1] + char_idx - len(line)
+
+def char_idx_at_display_col(line, display_col):
+    """
+    返回显示位置恰好为 display_col 的字符索引
+    若该位置落在全角字符的后半格或超出行尾，返回 None
+    """
+    cols = build_column_index(line)
+    i = bisect.bisect_left(cols, display_col, 0, len(line))
+    if i < len(line) and cols[i] == display_col:
+        return i
+    return None
+
+_has_text = re.compile(r'[^\s│┐┌└┘├┤┬┴╭╮╰╯]').search  # 有非空白、非框线字符
+
 
 def has_text_and_pipe(line):
     """检查行是否含有文字和竖线"""
-    has_text = bool(re.search(r'[^\s│┐┌└┘├┤┬┴╭╮╰╯]', line))  # 有非空白、非框线字符
-    has_pipe = '│' in line
-    return has_text and has_pipe
+    # 先做成本很低的竖线判断，绝大多数正文行到此为止
+    return '│' in line and _has_text(line) is not None
+
+# 各类框线字符的作用：
+# - 竖线"│"（所在行须含文字）和 BOTTOM_GLYPHS 中的字符向上对齐到最近的 TARGET_CORNERS
+# - 目标角字符右移（插入"─"）时，PAIRED_CORNERS 给出 bottom_line 中需要同时右移的配对字符
+# extended_glyphs 时还对齐"├"、"┤"连接处和圆角框（"╯"对齐到"╮"/"╭"，竖线也可对齐到"┬"）
+TARGET_CORNERS = '┐┌'
+BOTTOM_GLYPHS = '┘'
+EXTENDED_TARGET_CORNERS = '┐┌╮╭┬'
+EXTENDED_BOTTOM_GLYPHS = '┘├┤╯'
+PAIRED_CORNERS = {'┐': '┘', '┌': '└', '╮': '╯', '╭': '╰', '┬': '┴'}
+BOX_GLYPHS_ALL = '│┐┌└┘├┤┬┴╭╮╰╯'
+_BOX_GLYPH = re.compile(f'[{BOX_GLYPHS_ALL}]')
+
+def glyph_roles(extended_glyphs=False):
+    """返回 (目标角字符, 与"┘"同样处理的字符)"""
+    if extended_glyphs:
+        return EXTENDED_TARGET_CORNERS, EXTENDED_BOTTOM_GLYPHS
+    return TARGET_CORNERS, BOTTOM_GLYPHS
+
+@functools.lru_cache(maxsize=16384)
+def tokenize_line(line):
+    """
+    单次扫描一行，找出其中所有框线字符（│┐┌└┘├┤┬┴╭╮╰╯）
+    返回: {字符: ((字符索引, 显示位置), ...)}，每种字符按字符索引升序
+    查找竖线、下角标字符、角字符和配对角字符都使用这里的结果，不再各自扫描整行；
+    同一行内容只扫描一次（逐轮对齐时未改动的行直接复用）
+    """
+    glyphs = {}
+    cols = None
+    # 一个字符类正则从左到右扫描一遍，在 C 层跳过其余字符
+    for match in _BOX_GLYPH.finditer(line):
+        if cols is None:
+            # 实际显示位置 = 字符索引 + 前面全角字符的数量，由行索引直接给出
+            cols = build_column_index(line)
+        i = match.start()
+        glyphs.setdefault(match.group(), []).append((i, cols[i]))  # (字符索引, 显示位置)
+    return {glyph: tuple(positions) for glyph, positions in glyphs.items()}
+
+def find_glyph_positions(line, chars):
+    """
+    返回行中属于 chars 的所有框线字符的 (字符索引, 显示位置)，按字符索引升序（结果只读，不要修改）
+    """
+    tokens = tokenize_line(line)
+    if len(chars) == 1:
+        return tokens.get(chars, ())
+    positions = [position for char in chars for position in tokens.get(char, ())]
+    positions.sort()
+    return positions
 
 def find_all_pipes(line):
     """
     找到行中所有竖线的位置（考虑包括汉字在内的全角字符占2个字符位置）
     返回: [(字符索引, 显示位置), ...]
     """
-    positions = []
-    for i, char in enumerate(line):
-        if char == '│':
-            # 计算0到i之间占两个位置的字符数量
-            amount_of_wide_chars = count_wide_chars(line[:i])
-            # 实际显示位置 = 字符索引 + 前面全角字符的数量
-            actual_pos = i + amount_of_wide_chars
-            positions.append((i, actual_pos))  # (字符索引, 显示位置)
-    return positions
+    return find_glyph_positions(line, '│')
 
-def find_all_bottom_corners(line):
+def find_all_bottom_corners(line, chars=BOTTOM_GLYPHS):
     """
-    找到行中所有下角标字符"┘"的位置（考虑包括汉字在内的全角字符占2个字符位置）
+    找到行中所有下角标字符"┘"（或 chars 中其他同样处理的字符）的位置（考虑包括汉字在内的全角字符占2个字符位置）
     返回: [(字符索引, 显示位置), ...]
     """
-    positions = []
-    for i, char in enumerate(line):
-        if char == '┘':
-            # 计算0到i之间占两个位置的字符数量
-            amount_of_wide_chars = count_wide_chars(line[:i])
-            # 实际显示位置 = 字符索引 + 前面全角字符的数量
-            actual_pos = i + amount_of_wide_chars
-            positions.append((i, actual_pos))  # (字符索引, 显示位置)
-    return positions
-
-pipe_lines = []  # (line_idx, line, pipe_positions[]) where pipe_positions is [(char_idx, display_pos), ...]
-for idx, line in enumerate(lines):
-    if has_text_and_pipe(line):
-        pipe_positions = find_all_pipes(line)
-        if pipe_positions:
-            pipe_lines.append((idx, line, pipe_positions))
-
-# 若无匹配行，直接输出原文
-if not pipe_lines:
-    if args.debug:
-        print("No lines with text and vertical line detected, output original text.")
-    if args.output:
-        try:
-            with open(args.output, 'w', encoding='utf-8') as f:
-                f.write(text_raw)
-            if args.debug:
-                print(f"结果已保存到: {args.output}")
-        except Exception as e:
-            print(f"错误: 无法写入文件 {args.output}: {e}", file=sys.stderr)
-            sys.exit(1)
-    else:
-        print(text_raw, end="")
-    sys.exit(0)
+    return find_glyph_positions(line, chars)
 
-if args.debug:
-    print("====== MATCHED LINES (text + │) ======")
-    for idx, line, pipe_positions in pipe_lines:
-        display_positions = [display_pos for _, display_pos in pipe_positions]
-        print(f"Line {idx+1:3d} | display_columns={display_positions} | {repr(line)}")
-    print("=====================================\n")
+def find_pipe_lines(lines, rows=None):
+    """
+    查找所有含文字和竖线的行
+    rows: 可选，只检查这些行（行号升序）
+    返回: [(line_idx, line, pipe_positions), ...]，pipe_positions 为 [(char_idx, display_pos), ...]
+    """
+    pipe_lines = []
+    for idx in range(len(lines)) if rows is None else rows:
+        line = lines[idx]
+        if has_text_and_pipe(line):
+            pipe_positions = find_all_pipes(line)
+            if pipe_positions:
+                pipe_lines.append((idx, line, pipe_positions))
+    return pipe_lines
 
 
 # ---------------------------------------
 # Step 2: 为每个含竖线的行找到最近的┐或┌位置
 # ---------------------------------------
-def find_nearest_corner(pipe_line_idx, pipe_display_col, lines, row_range=8, col_range=5, search_chars='┐┌'):
+class CornerIndex:
+    """
+    文档级角字符索引：按行记录角字符（默认┐┌）的显示位置，按显示位置升序排列
+    查找最近角字符时只需在每行做 ±col_range 的区间查询，无需重新遍历整行
+    行内容改变后调用 update_row() 只重建该行的索引
+    """
+
+    def __init__(self, lines, chars=TARGET_CORNERS):
+        self.chars = chars
+        self.rows = [self._index_line(line) for line in lines]
+
+    def _index_line(self, line):
+        """返回 (显示位置列表, 字符索引列表)，该行没有角字符时返回 None"""
+        positions = find_glyph_positions(line, self.chars)
+        if not positions:
+            return None
+        return [display_col for _, display_col in positions], [char_idx for char_idx, _ in positions]
+
+    def update_row(self, row, line):
+        """行内容改变（插入空格或"─"等）后更新该行的索引"""
+        self.rows[row] = self._index_line(line)
+
+    def nearest(self, row_idx, display_col, row_range, col_range):
+        """
+        在 row_idx 上方 row_range 行、左右 col_range 列内查找最近的角字符
+        距离计算与选择顺序同 find_nearest_corner
+        返回: (target_display_col, distance, row_offset, target_line_idx, target_char_idx)
+        """
+        best_pos = None
+        best_distance = float('inf')
+        best_row_offset = None
+        best_line_idx = None
+        best_char_idx = None
+
+        for row_offset in range(1, row_range + 1):
+            check_line_idx = row_idx - row_offset
+            if check_line_idx < 0:
+                break
+            entry = self.rows[check_line_idx]
+            if entry is None:
+                continue
+            display_cols, char_idxs = entry
+            lo = bisect.bisect_left(display_cols, display_col - col_range)
+            hi = bisect.bisect_right(display_cols, display_col + col_range)
+            for k in range(lo, hi):
+                distance = abs(display_cols[k] - display_col) + row_offset * 0.5
+                if distance < best_distance:
+                    best_distance = distance
+                    best_pos = display_cols[k]
+                    best_row_offset = row_offset
+                    best_line_idx = check_line_idx
+                    best_char_idx = char_idxs[k]
+
+        if best_pos is not None:
+            return best_pos, best_distance, best_row_offset, best_line_idx, best_char_idx
+
+        return None, None, None, None, None
+
+    def candidates(self, row_idx, display_col, row_range, col_range):
+        """
+        返回 row_idx 上方 row_range 行、左右 col_range 列内的所有角字符，同一显示位置只取距离最近的一个（距离同 nearest）
+        返回: [(target_display_col, distance, row_offset, target_line_idx, target_char_idx), ...]，按显示位置升序
+        """
+        best = {}
+        for row_offset in range(1, row_range + 1):
+            check_line_idx = row_idx - row_offset
+            if check_line_idx < 0:
+                break
+            entry = self.rows[check_line_idx]
+            if entry is None:
+                continue
+            display_cols, char_idxs = entry
+            lo = bisect.bisect_left(display_cols, display_col - col_range)
+            hi = bisect.bisect_right(display_cols, display_col + col_range)
+            for k in range(lo, hi):
+                col = display_cols[k]
+                distance = abs(col - display_col) + row_offset * 0.5
+                if col not in best or distance < best[col][1]:
+                    best[col] = (col, distance, row_offset, check_line_idx, char_idxs[k])
+        return [best[col] for col in sorted(best)]
+
+def find_nearest_corner(pipe_line_idx, pipe_display_col, lines, row_range=8, col_range=5, search_chars=TARGET_CORNERS,
+                        corner_index=None):
     """
     查找与竖线或下角标字符最近的角字符位置（考虑显示位置）
     pipe_display_col: 竖线或下角标字符的显示位置
-    search_chars: 要查找的角字符，默认为'┐┌'（用于竖线），也可以是'┐┌'（用于┘）
+    search_chars: 要查找的角字符（须为框线字符），默认为'┐┌'；extended_glyphs 时为 EXTENDED_TARGET_CORNERS
+    corner_index: 可选的 CornerIndex（需与 search_chars 一致），提供时改为区间查询
     在上下行（row_range行内）和左右列（col_range列内）范围内查找最近的角字符
-    返回: (target_display_col, distance, source, target_line_idx, target_char_idx)
+    返回: (target_display_col, distance, row_offset, target_line_idx, target_char_idx)
+    row_offset 为角字符所在行在上方第几行
     """
+    if corner_index is not None and corner_index.chars == search_chars:
+        return corner_index.nearest(pipe_line_idx, pipe_display_col, row_range, col_range)
+
     best_pos = None
     best_distance = float('inf')
-    best_source = None
+    best_row_offset = None
     best_line_idx = None
     best_char_idx = None
-    
+
     # 在Top line中查找
     for row_offset in range(1, row_range + 1):
         if pipe_line_idx - row_offset >= 0:
             check_line_idx = pipe_line_idx - row_offset
-            check_line = lines[check_line_idx]
-            # 查找该行中所有目标角字符，计算它们的显示位置
-            for char_idx, char in enumerate(check_line):
-                if char in search_chars:
-                    # 计算该字符的显示位置
-                    amount_of_wide_chars = count_wide_chars(check_line[:char_idx])
-                    display_col = char_idx + amount_of_wide_chars
-                    # 检查是否在范围内
-                    col_diff = display_col - pipe_display_col
-                    if abs(col_diff) <= col_range:
-                        # 计算距离：优先考虑列距离，行距离作为次要因素
-                        distance = abs(col_diff) + row_offset * 0.5
-                        if distance < best_distance:
-                            best_distance = distance
-                            best_pos = display_col  # 返回显示位置
-                            best_source = f'above_{row_offset}'
-                            best_line_idx = check_line_idx
-                            best_char_idx = char_idx
-        
+            # 该行中所有目标角字符及其显示位置（来自 tokenize_line）
+            for char_idx, display_col in find_glyph_positions(lines[check_line_idx], search_chars):
+                # 检查是否在范围内
+                col_diff = display_col - pipe_display_col
+                if abs(col_diff) <= col_range:
+                    # 计算距离：优先考虑列距离，行距离作为次要因素
+                    distance = abs(col_diff) + row_offset * 0.5
+                    if distance < best_distance:
+                        best_distance = distance
+                        best_pos = display_col  # 返回显示位置
+                        best_row_offset = row_offset
+                        best_line_idx = check_line_idx
+                        best_char_idx = char_idx
+
     if best_pos is not None:
-        return best_pos, best_distance, best_source, best_line_idx, best_char_idx
-    
+        return best_pos, best_distance, best_row_offset, best_line_idx, best_char_idx
+
     return None, None, None, None, None
 
-def find_targets_for_all_lines(lines):
+class AlignTarget:
+    """
+    一个需要对齐的字符（竖线"│"或下角标字符"┘"）及其目标角字符
+    row_offset: 目标角字符在上方第几行
+    """
+
+    __slots__ = ('char_idx', 'display_pos', 'target_col', 'distance', 'row_offset',
+                 'target_line_idx', 'target_char_idx', 'char_type')
+
+    def __init__(self, char_idx, display_pos, target_col, distance, row_offset,
+                 target_line_idx, target_char_idx, char_type):
+        self.char_idx = char_idx                # 字符索引
+        self.display_pos = display_pos          # 当前显示位置
+        self.target_col = target_col            # 目标角字符的显示位置
+        self.distance = distance
+        self.row_offset = row_offset
+        self.target_line_idx = target_line_idx  # 目标角字符所在行
+        self.target_char_idx = target_char_idx  # 目标角字符的字符索引
+        self.char_type = char_type              # '│'、'┘'（extended_glyphs 时还有 '├'、'┤'、'╯'）
+
+    @property
+    def aligned(self):
+        return self.display_pos == self.target_col
+
+    def __repr__(self):
+        return (f"AlignTarget({self.char_type!r} at char_idx {self.char_idx}, "
+                f"display_col {self.display_pos} -> {self.target_col})")
+
+_by_char_idx = operator.attrgetter('char_idx')
+
+
+def find_targets_for_all_lines(lines, row_range=DEFAULT_ROW_RANGE, col_range=DEFAULT_COL_RANGE,
+                               corner_row_range=DEFAULT_CORNER_ROW_RANGE, corner_col_range=DEFAULT_CORNER_COL_RANGE,
+                               debug=False, corner_index=None, rows=None, backend='auto', extended_glyphs=False):
     """
     为所有含竖线的行找到目标位置
-    返回: targets = {line_idx: [(char_idx, display_pos, target_col, distance, source), ...]}
+    corner_index: 与 lines 同步的 CornerIndex（角字符须与 glyph_roles(extended_glyphs) 一致），未提供时临时建立
+    rows: 可选，只为这些行查找目标位置（用于只重算上一轮改动波及的行）
+    backend: 'python'、'numpy' 或 'auto'（区域足够大时使用 NumPy），见 use_numpy_backend；
+             只为部分行查找或 debug 时始终使用纯 Python 实现
+    extended_glyphs: 为 True 时"├"、"┤"、"╯"与"┘"同样对齐，目标角字符还包括"╮"、"╭"、"┬"
+    返回: targets = {line_idx: [AlignTarget, ...]}
     """
+    corners, bottom_glyphs = glyph_roles(extended_glyphs)
+    if rows is None and not debug and use_numpy_backend(backend, lines):
+        return _find_targets_numpy(lines, row_range, col_range, corner_row_range, corner_col_range,
+                                   corners, bottom_glyphs)
+    if corner_index is None:
+        corner_index = CornerIndex(lines, corners)
+    rows = range(len(lines)) if rows is None else sorted(rows)
+
     # 重新查找所有含文字和竖线的行
-    current_pipe_lines = []
-    for idx, line in enumerate(lines):
-        if has_text_and_pipe(line):
-            pipe_positions = find_all_pipes(line)
-            if pipe_positions:
-                current_pipe_lines.append((idx, line, pipe_positions))
-    
+    current_pipe_lines = find_pipe_lines(lines, rows)
+
     # 为每个含竖线的行，为每个竖线找到目标位置
     targets = {}
     for line_idx, line, pipe_positions in current_pipe_lines:
         line_targets = []
         for char_idx, display_pos in pipe_positions:
-            target_col, distance, source, target_line_idx, target_char_idx = find_nearest_corner(line_idx, display_pos, lines, search_chars='┐┌')
+            target_col, distance, row_offset, target_line_idx, target_char_idx = find_nearest_corner(line_idx, display_pos, lines, row_range=row_range, col_range=col_range, search_chars=corners, corner_index=corner_index)
             if target_col is not None:
-                line_targets.append((char_idx, display_pos, target_col, distance, source, target_line_idx, target_char_idx, '│'))
-                if args.debug:
-                    print(f"Line {line_idx+1}: │ at char_idx {char_idx} (display_col {display_pos}) -> target ┐/┌ at col {target_col} (from {source}, distance={distance})")
+                line_targets.append(AlignTarget(char_idx, display_pos, target_col, distance, row_offset, target_line_idx, target_char_idx, '│'))
+                if debug:
+                    print(f"Line {line_idx+1}: │ at char_idx {char_idx} (display_col {display_pos}) -> target ┐/┌ at col {target_col} (from above_{row_offset}, distance={distance})")
             else:
-                if args.debug:
+                if debug:
                     print(f"Line {line_idx+1}: │ at char_idx {char_idx} (display_col {display_pos}) -> no ┐/┌ found")
         if line_targets:
             targets[line_idx] = line_targets
-    
+
     # 处理含下角标字符"┘"的行
-    for idx, line in enumerate(lines):
-        bottom_corner_positions = find_all_bottom_corners(line)
+    for idx in rows:
+        line = lines[idx]
+        bottom_corner_positions = find_all_bottom_corners(line, bottom_glyphs)
         if bottom_corner_positions:
             line_targets = []
             for char_idx, display_pos in bottom_corner_positions:
+                char_type = line[char_idx]
                 # 为"┘"查找对应的"┐"或"┌"（通常在top_line中，向上查找）
-                target_col, distance, source, target_line_idx, target_char_idx = find_nearest_corner(idx, display_pos, lines, row_range=10, col_range=3, search_chars='┐┌')
+                target_col, distance, row_offset, target_line_idx, target_char_idx = find_nearest_corner(idx, display_pos, lines, row_range=corner_row_range, col_range=corner_col_range, search_chars=corners, corner_index=corner_index)
                 if target_col is not None:
-                    line_targets.append((char_idx, display_pos, target_col, distance, source, target_line_idx, target_char_idx, '┘'))
-                    if args.debug:
-                        print(f"Line {idx+1}: ┘ at char_idx {char_idx} (display_col {display_pos}) -> target ┐/┌ at col {target_col} (from {source}, distance={distance})")
+                    line_targets.append(AlignTarget(char_idx, display_pos, target_col, distance, row_offset, target_line_idx, target_char_idx, char_type))
+                    if debug:
+                        print(f"Line {idx+1}: {char_type} at char_idx {char_idx} (display_col {display_pos}) -> target ┐/┌ at col {target_col} (from above_{row_offset}, distance={distance})")
                 else:
-                    if args.debug:
-                        print(f"Line {idx+1}: ┘ at char_idx {char_idx} (display_pos {display_pos}) -> no ┐/┌ found")
+                    if debug:
+                        print(f"Line {idx+1}: {char_type} at char_idx {char_idx} (display_pos {display_pos}) -> no ┐/┌ found")
             if line_targets:
                 if idx not in targets:
                     targets[idx] = []
                 targets[idx].extend(line_targets)
-    
+
     return targets
 
-# 初始查找目标位置
-if args.debug:
-    print("====== INITIAL TARGET FINDING ======")
-targets = find_targets_for_all_lines(lines)
 
-if args.debug:
-    print()
+# ---------------------------------------
+# NumPy 后端：整篇文档一次性计算显示位置并批量查找目标位置（可选）
+# ---------------------------------------
+@functools.lru_cache(maxsize=1)
+def load_numpy():
+    """
+    按需导入 NumPy 并返回该模块，未安装时返回 None
+    导入 NumPy 比对齐一个普通文档还慢，因此只在确实使用 NumPy 后端时才导入
+    """
+    global numpy
+    try:
+        import numpy as module
+    except ImportError:  # 可选依赖：未安装时只使用纯 Python 实现
+        return None
+    numpy = module
+    return module
+
+def use_numpy_backend(backend, lines):
+    """
+    backend 为 'numpy'，或为 'auto' 且 lines 的字符数达到 NUMPY_MIN_CHARS 时使用 NumPy
+    未安装 NumPy 时一律返回 False（回退到纯 Python 实现）
+    """
+    if backend not in TARGET_BACKENDS:
+        raise ValueError(f"未知的后端: {backend}")
+    if backend == 'python' or (backend == 'auto' and sum(map(len, lines)) < NUMPY_MIN_CHARS):
+        return False
+    return load_numpy() is not None
+
+@functools.lru_cache(maxsize=1)
+def _numpy_width_table():
+    """
+    码位 → 显示宽度的查找表（0 表示尚未分类），覆盖全部 Unicode 码位
+    ASCII 和流程图中常见的符号预先填好，其余码位在第一次出现时按 _CHAR_WIDTHS 分类并填入
+    """
+    table = numpy.zeros(0x110000, dtype=numpy.int8)
+    table[:0x80] = 1
+    for char in _NARROW_SYMBOLS:
+        table[ord(char)] = 1
+    return table
+
+def _numpy_char_widths(codes):
+    """返回码位数组中每个字符的显示宽度（与 char_width 一致）"""
+    table = _numpy_width_table()
+    widths = table[codes]
+    unknown = widths == 0
+    if unknown.any():
+        for code in numpy.unique(codes[unknown]).tolist():
+            table[code] = _CHAR_WIDTHS[chr(code)]
+        widths = table[codes]
+    return widths
+
+def scan_glyphs_numpy(lines, glyphs):
+    """
+    用 NumPy 一次性定位所有行中的 glyphs 字符：所有行拼接为一个码位数组，按宽度表得到每个字符的宽度，
+    累加后减去行首的累加值即为每个字符的显示位置（等价于对每行调用 build_column_index）
+    返回: {glyph: (行号数组, 字符索引数组, 显示位置数组)}，按 (行号, 字符索引) 升序
+    """
+    load_numpy()
+    lengths = numpy.fromiter(map(len, lines), dtype=numpy.int64, count=len(lines))
+    starts = numpy.zeros(len(lines) + 1, dtype=numpy.int64)
+    numpy.cumsum(lengths, out=starts[1:])
+    codes = numpy.frombuffer("".join(lines).encode('utf-32-le', 'surrogatepass'), dtype=numpy.uint32)
+
+    # columns[p] 为拼接后第 p 个字符之前所有字符的宽度之和
+    columns = numpy.zeros(len(codes) + 1, dtype=numpy.int64)
+    numpy.cumsum(_numpy_char_widths(codes), out=columns[1:])
+
+    found = {}
+    for glyph in glyphs:
+        flat = numpy.flatnonzero(codes == ord(glyph))
+        rows = numpy.searchsorted(starts, flat, side='right') - 1
+        found[glyph] = (rows, flat - starts[rows], columns[flat] - columns[starts[rows]])
+    return found
+
+def nearest_corners_numpy(query_rows, query_cols, corner_rows, corner_cols, row_range, col_range):
+    """
+    批量查找最近的角字符，结果与逐个调用 CornerIndex.nearest 相同
+    （距离为列距离 + 行距离 * 0.5；距离相同时取行距离小的，再取左边的）
+    corner_rows / corner_cols 须按 (行号, 显示位置) 升序
+    对每个行距离，用 searchsorted 求出每个查询在该行 ±col_range 内的角字符区间，再逐个比较区间内第 k 个角字符
+    返回: (角字符序号数组，未找到时为 -1, 行距离数组)
+    """
+    load_numpy()
+    count = len(query_rows)
+    best = numpy.full(count, -1, dtype=numpy.int64)
+    best_offset = numpy.zeros(count, dtype=numpy.int64)
+    if count == 0 or len(corner_rows) == 0:
+        return best, best_offset
+    # 距离的两倍（整数）：2 * 列距离 + 行距离
+    best_distance2 = numpy.full(count, numpy.iinfo(numpy.int64).max, dtype=numpy.int64)
+    # 每个角字符的键 = 行号 * span + 显示位置 + col_range，同一行的查找区间不会越过相邻行
+    span = int(max(corner_cols.max(), query_cols.max())) + 2 * col_range + 1
+    keys = corner_rows * span + corner_cols + col_range
+
+    for row_offset in range(1, row_range + 1):
+        rows = query_rows - row_offset
+        low = rows * span + query_cols
+        lo = numpy.searchsorted(keys, low, side='left')
+        hi = numpy.searchsorted(keys, low + 2 * col_range, side='right')
+        hits = numpy.where(rows >= 0, hi - lo, 0)
+        for k in range(int(hits.max())):
+            queries = numpy.flatnonzero(hits > k)
+            candidates = lo[queries] + k
+            distance2 = 2 * numpy.abs(corner_cols[candidates] - query_cols[queries]) + row_offset
+            better = distance2 < best_distance2[queries]
+            queries = queries[better]
+            best_distance2[queries] = distance2[better]
+            best[queries] = candidates[better]
+            best_offset[queries] = row_offset
+    return best, best_offset
+
+def _merge_glyphs_numpy(found, chars):
+    """合并 scan_glyphs_numpy 结果中 chars 的各字符，按 (行号, 字符索引) 升序"""
+    rows, char_idxs, cols = (numpy.concatenate(parts) for parts in zip(*(found[char] for char in chars)))
+    if len(chars) > 1:
+        order = numpy.lexsort((char_idxs, rows))
+        rows, char_idxs, cols = rows[order], char_idxs[order], cols[order]
+    return rows, char_idxs, cols
+
+def _find_targets_numpy(lines, row_range, col_range, corner_row_range, corner_col_range,
+                        corners=TARGET_CORNERS, bottom_glyphs=BOTTOM_GLYPHS):
+    """find_targets_for_all_lines 的 NumPy 实现（结果和 targets 的顺序与纯 Python 实现相同）"""
+    found = scan_glyphs_numpy(lines, '│' + corners + bottom_glyphs)
+    corner_rows, corner_idxs, corner_cols = _merge_glyphs_numpy(found, corners)
+    corner_rows_list, corner_idxs_list, corner_cols_list = corner_rows.tolist(), corner_idxs.tolist(), corner_cols.tolist()
+
+    # 竖线只统计含文字的行（同 find_pipe_lines）
+    pipe_rows, pipe_idxs, pipe_cols = found['│']
+    text_rows = [row for row in numpy.unique(pipe_rows).tolist() if has_text_and_pipe(lines[row])]
+    keep = numpy.isin(pipe_rows, text_rows)
+    queries = [(pipe_rows[keep], pipe_idxs[keep], pipe_cols[keep], row_range, col_range),
+               _merge_glyphs_numpy(found, bottom_glyphs) + (corner_row_range, corner_col_range)]
+
+    targets = {}
+    for rows, char_idxs, cols, query_row_range, query_col_range in queries:
+        best, offsets = nearest_corners_numpy(rows, cols, corner_rows, corner_cols, query_row_range, query_col_range)
+        for row, char_idx, display_pos, corner, row_offset in zip(rows.tolist(), char_idxs.tolist(), cols.tolist(),
+                                                                  best.tolist(), offsets.tolist()):
+            if corner < 0:
+                continue
+            target_col = corner_cols_list[corner]
+            distance = abs(target_col - display_pos) + row_offset * 0.5
+            targets.setdefault(row, []).append(AlignTarget(char_idx, display_pos, target_col, distance, row_offset,
+                                                           corner_rows_list[corner], corner_idxs_list[corner],
+                                                           lines[row][char_idx]))
+    return targets
 
 
 # ---------------------------------------
 # Step 3: 对齐所有含竖线的行
 # ---------------------------------------
-def find_paired_corner_in_bottom_line(lines, top_line_idx, corner_char, corner_idx, max_search_range=10):
+def find_paired_corner_in_bottom_line(lines, top_line_idx, corner_char, corner_idx,
+                                      max_search_range=PAIRED_CORNER_SEARCH_RANGE):
     """
     在对应的 bottom_line 中查找配对的角字符
     top_line 中的 ┐ 配对 bottom_line 中的 ┘
-    top_line 中的 ┌ 配对 bottom_line 中的 └
+    top_line 中的 ┌ 配对 bottom_line 中的 └（圆角 ╮/╭ 配对 ╯/╰，┬ 配对 ┴，见 PAIRED_CORNERS）
     返回: (bottom_line_idx, paired_corner_idx) 或 (None, None)
     """
-    if corner_char == '┐':
-        paired_char = '┘'
-    elif corner_char == '┌':
-        paired_char = '└'
-    else:
+    paired_char = PAIRED_CORNERS.get(corner_char)
+    if paired_char is None:
         return None, None
-    
+
+    # 计算 top_line 中角字符的显示位置
+    top_display_col = display_col_of(lines[top_line_idx], corner_idx)
+
     # 从 top_line 向下查找对应的 bottom_line（包含配对角字符的行）
     for offset in range(1, max_search_range + 1):
         bottom_line_idx = top_line_idx + offset
         if bottom_line_idx >= len(lines):
             break
-        
-        bottom_line = lines[bottom_line_idx]
-        
-        # 在 bottom_line 中查找配对的角字符
+
+        # 在 bottom_line 中查找配对的角字符（来自 tokenize_line）
         # 应该在相同或相近的列位置查找
-        for i, char in enumerate(bottom_line):
-            if char == paired_char:
-                # 计算显示位置，检查是否与 top_line 中的角字符位置对应
-                amount_of_wide_chars = count_wide_chars(bottom_line[:i])
-                bottom_display_col = i + amount_of_wide_chars
-                
-                # 计算 top_line 中角字符的显示位置
-                top_line = lines[top_line_idx]
-                top_amount_of_wide_chars = count_wide_chars(top_line[:corner_idx])
-                top_display_col = corner_idx + top_amount_of_wide_chars
-                
-                # 如果显示位置相同或相近（允许1个字符的误差），认为是配对的
-                if abs(bottom_display_col - top_display_col) <= 1:
-                    return bottom_line_idx, i
-    
+        for i, bottom_display_col in tokenize_line(lines[bottom_line_idx]).get(paired_char, ()):
+            # 如果显示位置相同或相近（允许1个字符的误差），认为是配对的
+            if abs(bottom_display_col - top_display_col) <= 1:
+                return bottom_line_idx, i
+
     return None, None
 
-def adjust_line_for_pipe(line, char_idx, display_diff):
+_leading_whitespace = re.compile(r"\s*").match
+
+
+def pipe_edits(line, char_idx, display_diff, debug=False):
     """
-    调整一行中的单个竖线位置
+    计算调整一行中单个竖线位置所需的编辑（插入或删除竖线前的空格），不生成新的行
     char_idx: 竖线的字符索引
     display_diff: 显示位置的差值（目标显示位置 - 当前显示位置）
-    返回调整后的行和位置偏移量（用于后续竖线的位置调整）
+    返回: (edits, offset)，edits 为 [(start, end, 替换内容), ...]（按 start 降序，依次替换 [start, end) 即可），
+    offset 为位置偏移量（用于后续竖线的位置调整）；无法调整时 edits 为空
     """
     if display_diff == 0:
         # 已经对齐，无需调整
-        return line, 0
+        return [], 0
     elif display_diff > 0:
         # 竖线位置偏左，需要在竖线前插入空格
         # display_diff 是显示位置的差值，直接作为插入的空格数
-        new_line = line[:char_idx] + " " * display_diff + line[char_idx:]
-        return new_line, display_diff
+        return [(char_idx, char_idx, " " * display_diff)], display_diff
     else:
-        # 竖线位置偏右，需要删除竖线前的字符
+        # 竖线位置偏右，需要删除竖线前紧邻的空格
+        # 行首的连续空白（缩进）保留不动，只删除缩进之后、竖线之前的空格
         chars_to_remove = -display_diff
-        before_pipe = line[:char_idx]
-        
-        # 保留行首的连续空格（缩进）
-        leading_spaces = len(before_pipe) - len(before_pipe.lstrip())
-        content_after_indent = before_pipe[leading_spaces:]
-        
-        # 计算竖线前紧邻的空格数量（从右向左查找）
-        trailing_spaces = 0
-        for char in reversed(content_after_indent):
-            if char == ' ':
-                trailing_spaces += 1
-            else:
-                break
-        
+        leading_spaces = _leading_whitespace(line, 0, char_idx).end()
+        keep_end = char_idx - chars_to_remove
+
         # 优先删除竖线前的空格
-        if chars_to_remove <= trailing_spaces:
-            # 有足够的空格可以删除
-            spaces_to_keep = trailing_spaces - chars_to_remove
-            # 保留行首缩进 + 内容（去掉末尾的空格）+ 保留的空格 + 竖线及之后的内容
-            content_without_trailing = content_after_indent[:-trailing_spaces] if trailing_spaces > 0 else content_after_indent
-            new_line = " " * leading_spaces + content_without_trailing + " " * spaces_to_keep + line[char_idx:]
-            return new_line, display_diff
+        if keep_end >= leading_spaces and line.endswith(" " * chars_to_remove, keep_end, char_idx):
+            # 有足够的空格可以删除：直接切掉竖线前的 chars_to_remove 个空格
+            edits = [(keep_end, char_idx, "")]
+            if not line.startswith(" " * leading_spaces):
+                # 缩进中含制表符等空白时，与旧实现一致地把缩进规整为空格
+                edits.append((0, leading_spaces, " " * leading_spaces))
+            return edits, display_diff
         else:
             # 竖线前的空格不够，无法通过删除空格对齐
             # 这种情况下，不调整该行，让下一轮迭代时重新查找目标位置
-            # 返回原行和0偏移，表示未进行任何调整
-            if args.debug:
+            # 返回空的编辑和0偏移，表示未进行任何调整
+            if debug:
+                content_after_indent = line[leading_spaces:char_idx]
+                trailing_spaces = len(content_after_indent) - len(content_after_indent.rstrip(' '))
                 print(f"    Warning: Not enough spaces before pipe (need {chars_to_remove}, have {trailing_spaces}), skipping adjustment")
-            return line, 0
+            return [], 0
+
+def adjust_line_for_pipe(line, char_idx, display_diff, debug=False):
+    """
+    调整一行中的单个竖线位置（见 pipe_edits）
+    返回调整后的行和位置偏移量（用于后续竖线的位置调整）
+    """
+    edits, offset = pipe_edits(line, char_idx, display_diff, debug=debug)
+    for start, end, text in edits:
+        line = line[:start] + text + line[end:]
+    return line, offset
+
+class AlignStats:
+    """
+    对齐过程的分阶段计时和计数（--stats），以 JSON 输出
+    各函数的 stats 参数为 None 时不做任何计时和计数
+    stages 为各阶段耗时（秒），多个区域的耗时累加（多进程对齐时为各进程耗时之和）；
+    round_seconds[i] 为所有区域第 i+1 轮对齐的耗时之和
+    """
+
+    COUNTERS = ('regions', 'cached_regions', 'pipe_lines', 'pipes', 'corners', 'targets',
+                'spaces_inserted', 'spaces_removed', 'widenings', 'dashes_inserted', 'not_enough_spaces')
+
+    def __init__(self):
+        self.stages = {}
+        self.round_seconds = []
+        self.rounds = 0                  # 各区域中最多的迭代轮数（含命中缓存的区域）
+        self.max_iterations_hit = False  # 是否有区域达到最大迭代次数时仍未对齐
+        self.regions = 0                 # 对齐的区域数
+        self.cached_regions = 0          # 其中直接使用缓存结果的区域数
+        self.pipe_lines = 0              # 含文字和竖线的行数
+        self.pipes = 0                   # 这些行中的竖线数
+        self.corners = 0                 # 角字符（┐┌）数
+        self.targets = 0                 # 找到目标角字符的竖线和下角标字符数
+        self.spaces_inserted = 0         # 插入的空格数
+        self.spaces_removed = 0          # 删除的空格数
+        self.widenings = 0               # 在角字符前插入"─"（目标右移）的次数
+        self.dashes_inserted = 0         # 插入的"─"数（含配对的 bottom_line）
+        self.not_enough_spaces = 0       # 因竖线前空格不够而无法删除空格的次数
+
+    def add_time(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def add_round(self, round_num, seconds):
+        while len(self.round_seconds) < round_num:
+            self.round_seconds.append(0.0)
+        self.round_seconds[round_num - 1] += seconds
+
+    def add_result(self, result, max_iterations):
+        """按一个区域的对齐结果 (aligned_lines, iterations, unaligned_rows) 更新 rounds 和 max_iterations_hit"""
+        _, iterations, unaligned_rows = result
+        if iterations is not None:
+            self.rounds = max(self.rounds, iterations)
+            self.max_iterations_hit = self.max_iterations_hit or (iterations >= max_iterations and bool(unaligned_rows))
+
+    def merge(self, other):
+        """合并另一个 AlignStats（如进程池中单个区域的统计）"""
+        for stage, seconds in other.stages.items():
+            self.add_time(stage, seconds)
+        for round_num, seconds in enumerate(other.round_seconds, 1):
+            self.add_round(round_num, seconds)
+        self.rounds = max(self.rounds, other.rounds)
+        self.max_iterations_hit = self.max_iterations_hit or other.max_iterations_hit
+        for name in self.COUNTERS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def as_dict(self):
+        result = dict(stages=self.stages, round_seconds=self.round_seconds,
+                      rounds=self.rounds, max_iterations_hit=self.max_iterations_hit)
+        result.update((name, getattr(self, name)) for name in self.COUNTERS)
+        return result
+
+class FlowchartDocument:
+    """
+    可原地修改的文档：所有行保存在同一个 rows 列表中，逐轮对齐时直接改写对应行
+    本轮改写的行转为字符列表（buffers），插入或删除空格、"─"都在列表上进行，
+    一轮结束时（end_round）每行只拼接一次，rows 中只保存每轮结束时的内容
+    为保持逐行处理的语义，每轮记录已处理行在处理时的内容（round journal），
+    查找配对角字符时通过 round_view() 看到与逐行处理一致的状态
+    corner_index / changed_rows 可选，一轮结束时按改写过的行同步更新
+    """
+
+    def __init__(self, lines, corner_index=None, changed_rows=None):
+        self.rows = list(lines)
+        self.corner_index = corner_index
+        self.changed_rows = changed_rows
+        self.buffers = {}
+        self.journal = {}
+        self.current_row = 0
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, row):
+        return self.line(row)
+
+    def line(self, row):
+        """某一行的当前内容"""
+        buffer = self.buffers.get(row)
+        return self.rows[row] if buffer is None else "".join(buffer)
+
+    def begin_round(self):
+        """开始新一轮：清空上一轮的 journal"""
+        self.journal.clear()
+        self.current_row = 0
+
+    def edit(self, row, edits):
+        """
+        在某一行的字符列表上依次执行 edits（[(start, end, 替换内容), ...]，见 pipe_edits），
+        如当前行插入或删除空格、目标角字符所在行插入"─"；已处理过的行先记下处理时的内容
+        """
+        if row < self.current_row and row not in self.journal:
+            self.journal[row] = self.line(row)
+        buffer = self.buffers.get(row)
+        if buffer is None:
+            buffer = self.buffers[row] = list(self.rows[row])
+        for start, end, text in edits:
+            buffer[start:end] = text
+
+    def finish_row(self, row, old=None):
+        """当前行处理完毕；old 为本行调整前的内容（本行被调整过时）"""
+        if old is not None:
+            self.journal[row] = old
+        self.current_row = row + 1
+
+    def end_round(self):
+        """一轮结束：将改写过的行拼接回 rows"""
+        for row, buffer in self.buffers.items():
+            line = "".join(buffer)
+            self.rows[row] = line
+            if self.corner_index is not None:
+                self.corner_index.update_row(row, line)
+            if self.changed_rows is not None:
+                self.changed_rows.add(row)
+        self.buffers.clear()
+
+    def round_view(self):
+        """本轮已处理的行返回处理时的内容，其余行返回当前内容"""
+        return _RoundView(self)
+
+    def text(self):
+        return "\n".join(map(self.line, range(len(self.rows))))
+
 
-def align_lines_one_round(lines, targets, round_num=1):
+class _RoundView:
+    """FlowchartDocument.round_view() 返回的只读视图"""
+
+    __slots__ = ('doc',)
+
+    def __init__(self, doc):
+        self.doc = doc
+
+    def __len__(self):
+        return len(self.doc.rows)
+
+    def __getitem__(self, row):
+        journal = self.doc.journal
+        return journal[row] if row in journal else self.doc.line(row)
+
+
+def align_lines_one_round(lines, targets, round_num=1, debug=False, corner_index=None, changed_rows=None,
+                          stats=None):
     """
     执行一轮对齐：处理每行第一个错位的竖线
+    lines: FlowchartDocument 时原地修改；为普通列表时复制一份再处理
+    corner_index: 可选的 CornerIndex，本轮改动的行会同步更新到索引中
+    changed_rows: 可选的集合，本轮改动过的行号（含插入"─"的 top/bottom 行）会加入其中
+    stats: 可选的 AlignStats，累计插入/删除的空格数、插入"─"的次数等
     返回: (aligned_lines, has_changes)
     """
-    if args.debug:
+    if isinstance(lines, FlowchartDocument):
+        doc = lines
+    else:
+        doc = FlowchartDocument(lines, corner_index, changed_rows)
+
+    if debug:
         print(f"\n====== ALIGNMENT ROUND {round_num} ======")
-    
-    aligned = []
+
+    doc.begin_round()
     has_changes = False
-    
-    for idx, line in enumerate(lines):
+
+    for idx in range(len(doc)):
         if idx not in targets:
             # 不含竖线或找不到目标，直接保留
-            aligned.append(line)
+            doc.current_row = idx + 1
             continue
-        
+
         # 获取该行所有需要调整的字符信息（竖线"│"或下角标字符"┘"）
         # 按位置从左到右排序，只处理第一个（最左边）错位的字符
-        line_targets = sorted(targets[idx], key=lambda x: x[0])  # 从左到右排序
-        
-        if args.debug:
-            char_types = [target[7] if len(target) > 7 else '│' for target in line_targets]
+        line_targets = sorted(targets[idx], key=_by_char_idx)  # 从左到右排序
+        line = doc.line(idx)
+
+        if debug:
+            char_types = [target.char_type for target in line_targets]
             print(f"[Line {idx+1}] original: {repr(line)}")
             print(f"  Found {len(line_targets)} items ({', '.join(set(char_types))}), will find the first misaligned one")
-        
-        if not line_targets:
-            aligned.append(line)
-            continue
-        
+
         # 找到第一个（最左边的）需要调整的字符（display_pos != target_col）
         first_misaligned = None
         for target in line_targets:
-            if len(target) > 7:
-                char_idx, display_pos, target_col, distance, source, target_line_idx, target_char_idx, char_type = target
-            else:
-                # 兼容旧格式（只有竖线）
-                char_idx, display_pos, target_col, distance, source, target_line_idx, target_char_idx = target
-                char_type = '│'
-            if display_pos != target_col:
+            if target.display_pos != target.target_col:
                 first_misaligned = target
                 break
-        
+
         # 如果没有找到需要调整的字符，说明都已对齐，直接保留原行
         if first_misaligned is None:
-            aligned.append(line)
+            doc.current_row = idx + 1
             continue
-        
+
         # 找到需要调整的字符，标记有变化
         has_changes = True
-        
-        if len(first_misaligned) > 7:
-            char_idx, display_pos, target_col, distance, source, target_line_idx, target_char_idx, char_type = first_misaligned
-        else:
-            # 兼容旧格式
-            char_idx, display_pos, target_col, distance, source, target_line_idx, target_char_idx = first_misaligned
-            char_type = '│'
-        
+
+        char_idx = first_misaligned.char_idx
+        display_pos = first_misaligned.display_pos
+        target_col = first_misaligned.target_col
+        target_line_idx = first_misaligned.target_line_idx
+        target_char_idx = first_misaligned.target_char_idx
+        char_type = first_misaligned.char_type
+
         # 计算需要调整的显示位置差值
         display_diff = target_col - display_pos
-        
-        if args.debug:
+
+        if debug:
             print(f"  First misaligned {char_type} at char_idx {char_idx} (display_col {display_pos}) -> target ┐/┌ at col {target_col}")
             print(f"    needed delta: {display_diff}")
-        
-        # 调整第一个字符（竖线"│"或下角标字符"┘"），后续字符会因为这次调整而相应变化
-        if char_type == '┘':
-            # 对于"┘"字符，使用与竖线相同的调整逻辑
-            current_line, offset = adjust_line_for_pipe(line, char_idx, display_diff)
-        else:
-            # 对于竖线"│"
-            current_line, offset = adjust_line_for_pipe(line, char_idx, display_diff)
-        
+
+        # 调整第一个字符（竖线"│"或下角标字符"┘"，两者调整逻辑相同），后续字符会因为这次调整而相应变化
+        widened_line = None
+        edits, offset = pipe_edits(line, char_idx, display_diff, debug=debug)
+        if stats is not None:
+            if offset > 0:
+                stats.spaces_inserted += offset
+            elif offset < 0:
+                stats.spaces_removed -= offset
+            elif display_diff < 0:
+                stats.not_enough_spaces += 1
+
         # 检查行是否真的改变了
-        if current_line == line and display_diff < 0:
+        if not edits and display_diff < 0:
             # 竖线偏右且没有足够的空格可删，尝试将目标位置右移
-            # 在目标角字符所在的行插入空格
+            # 在目标角字符所在的行插入"─"
             if target_line_idx is not None and target_char_idx is not None:
                 # 获取目标行的当前状态
-                if target_line_idx < len(aligned):
-                    target_line = aligned[target_line_idx]
-                else:
-                    target_line = lines[target_line_idx]
-                
+                target_line = doc.line(target_line_idx)
+
                 spaces_to_insert = -display_diff  # 需要右移的距离
-                
+
                 # 检查 target_char_idx 是否在有效范围内
                 if target_char_idx >= len(target_line):
-                    if args.debug:
+                    if debug:
                         print(f"    Warning: target_char_idx {target_char_idx} out of range for line {target_line_idx+1} (length {len(target_line)}), skipping target adjustment")
                     has_changes = False
-                    aligned.append(current_line)
+                    doc.finish_row(idx)
                     continue
-                
+
                 target_corner_char = target_line[target_char_idx]
-                
-                # 在目标角字符前插入"─"
-                new_target_line = target_line[:target_char_idx] + "─" * spaces_to_insert + target_line[target_char_idx:]
-                
+
                 # 在对应的 bottom_line 中查找配对的角字符（┐配对┘，┌配对└）
-                # 使用当前 lines 或 aligned 的状态来查找
-                # search_lines = aligned if target_line_idx < len(aligned) else lines
-                search_lines = lines
+                # 已处理过的行按处理时的内容查找
                 bottom_line_idx, paired_corner_idx = find_paired_corner_in_bottom_line(
-                    search_lines, target_line_idx, target_corner_char, target_char_idx
+                    doc.round_view(), target_line_idx, target_corner_char, target_char_idx
                 )
-                
+
                 if bottom_line_idx is not None and paired_corner_idx is not None:
                     # 找到配对的角字符，也需要在它前面插入相同数量的"─"
-                    # 获取 bottom_line 的当前状态
-                    if bottom_line_idx < len(aligned):
-                        bottom_line = aligned[bottom_line_idx]
+                    if debug:
+                        print(f"    Found paired corner '{doc.line(bottom_line_idx)[paired_corner_idx]}' in bottom_line {bottom_line_idx+1} at position {paired_corner_idx}, also adjusted")
+                    if bottom_line_idx == idx:
+                        # 配对的角字符就在当前行：与逐行处理一致，当前行按处理时的内容写回，
+                        # 插入"─"后的内容只在本轮其余行查找配对角字符时可见
+                        widened_line = line[:paired_corner_idx] + "─" * spaces_to_insert + line[paired_corner_idx:]
                     else:
-                        bottom_line = lines[bottom_line_idx]
-                    
-                    # 在配对角字符前插入"─"
-                    new_bottom_line = bottom_line[:paired_corner_idx] + "─" * spaces_to_insert + bottom_line[paired_corner_idx:]
-                    
-                    # 更新 bottom_line
-                    if bottom_line_idx < len(aligned):
-                        aligned[bottom_line_idx] = new_bottom_line
-                    else:
-                        lines[bottom_line_idx] = new_bottom_line
-                    
-                    if args.debug:
-                        print(f"    Found paired corner '{bottom_line[paired_corner_idx]}' in bottom_line {bottom_line_idx+1} at position {paired_corner_idx}, also adjusted")
-                
-                if target_line_idx < len(aligned):
-                    # 目标行已经处理过，直接更新 aligned
-                    aligned[target_line_idx] = new_target_line
-                else:
-                    # 目标行还没有处理，更新 lines 以便后续处理时使用
-                    lines[target_line_idx] = new_target_line
-                
-                if args.debug:
+                        doc.edit(bottom_line_idx, [(paired_corner_idx, paired_corner_idx, "─" * spaces_to_insert)])
+                    if stats is not None:
+                        stats.dashes_inserted += spaces_to_insert
+
+                # 在目标角字符前插入"─"
+                doc.edit(target_line_idx, [(target_char_idx, target_char_idx, "─" * spaces_to_insert)])
+                if stats is not None:
+                    stats.widenings += 1
+                    stats.dashes_inserted += spaces_to_insert
+
+                if debug:
                     print(f"    Adjusted target corner position by inserting {spaces_to_insert} '─' characters")
-                    print(f"    Target line {target_line_idx+1} updated: {repr(new_target_line)}")
+                    print(f"    Target line {target_line_idx+1} updated: {repr(doc.line(target_line_idx))}")
             else:
                 # 无法调整目标位置，跳过这一行
-                if args.debug:
+                if debug:
                     print(f"    Cannot adjust target position (target_line_idx={target_line_idx}), skipping this line")
                 has_changes = False
-        elif current_line == line:
+        elif not edits:
             # 行没有改变，不标记为有变化
             has_changes = False
-        
-        if args.debug:
-            print(f"  aligned: {repr(current_line)}\n")
-        
-        aligned.append(current_line)
-    
-    return aligned, has_changes
 
-# ---------------------------------------
-# Step 3: 迭代对齐所有含竖线的行
-# ---------------------------------------
-aligned = lines
-max_iterations = 10  # 最大迭代次数，防止无限循环
-iteration = 0
-has_changes = True
-
-while has_changes and iteration < max_iterations:
-    iteration += 1
-    
-    # 基于当前对齐结果，重新查找目标位置
-    if iteration > 1:
-        if args.debug:
-            print(f"\n====== RE-FINDING TARGETS (Round {iteration}) ======")
-        targets = find_targets_for_all_lines(aligned)
-        if args.debug:
-            print()
-    
-    # 执行一轮对齐
-    aligned, has_changes = align_lines_one_round(aligned, targets, iteration)
-    
-    if not has_changes:
-        if args.debug:
-            print(f"\n所有竖线已对齐，共执行 {iteration} 轮调整。")
-        break
+        if edits:
+            doc.edit(idx, edits)
+        if debug:
+            print(f"  aligned: {repr(doc.line(idx))}\n")
 
-if iteration >= max_iterations and has_changes:
-    if args.debug:
-        print(f"\n警告: 达到最大迭代次数 {max_iterations}，可能仍有未对齐的竖线。")
+        doc.finish_row(idx, line if edits else widened_line)
 
-# ---------------------------------------
-# Step 4: 输出最终结果
-# ---------------------------------------
-result = "\n".join(aligned)
+    doc.end_round()
+    return doc.rows, has_changes
 
-if args.debug:
-    print("====== FINAL OUTPUT ======")
-    print(result)
-    print("==========================")
 
-# 输出结果
-if args.output:
-    try:
-        with open(args.output, 'w', encoding='utf-8') as f:
-            f.write(result)
-        if args.debug:
-            print(f"\n结果已保存到: {args.output}")
-    except Exception as e:
-        print(f"错误: 无法写入文件 {args.output}: {e}", file=sys.stderr)
-        sys.exit(1)
-else:
-    print(result)
+def refresh_targets(targets, lines, changed_rows, corner_index, debug=False,
+                    row_range=DEFAULT_ROW_RANGE, col_range=DEFAULT_COL_RANGE,
+                    corner_row_range=DEFAULT_CORNER_ROW_RANGE, corner_col_range=DEFAULT_CORNER_COL_RANGE,
+                    extended_glyphs=False):
+    """
+    只为 changed_rows 波及的行重新查找目标位置，原地更新 targets 并清空 changed_rows
+    某行的目标位置只取决于该行本身和其上方查找范围内的角字符，
+    因此只需重算改动行及其下方 max(row_range, corner_row_range) 行
+    返回重算的行号集合
+    """
+    reach = max(row_range, corner_row_range)
+    dirty_rows = set()
+    for row in changed_rows:
+        dirty_rows.update(range(row, min(row + reach + 1, len(lines))))
+    changed_rows.clear()
+    for row in dirty_rows:
+        targets.pop(row, None)
+    targets.update(find_targets_for_all_lines(
+        lines, row_range=row_range, col_range=col_range,
+        corner_row_range=corner_row_range, corner_col_range=corner_col_range,
+        debug=debug, corner_index=corner_index, rows=dirty_rows, extended_glyphs=extended_glyphs))
+    return dirty_rows
+
+def find_misaligned_rows(targets):
+    """
+    返回仍有字符（竖线"│"或下角标字符"┘"）未对齐到目标位置的行号列表（升序）
+    """
+    return sorted(idx for idx, line_targets in targets.items()
+                  if any(not target.aligned for target in line_targets))
+
+_cell_text = re.compile('[^' + BOX_GLYPHS_ALL + ']*').match  # 从某位置到下一个框线字符之前的内容
+_cell_text_before = re.compile('[^' + BOX_GLYPHS_ALL + ']*$').search  # 到某位置为止、上一个框线字符之后的内容
+# 左边界（右侧紧接文字）优先对齐到"┌"/"╭"，右边界（左侧紧接文字）优先对齐到"┐"/"╮"
+_BORDER_CORNERS = {'left': '┌╭', 'right': '┐╮'}
+
+
+def _border_role(line, char_idx):
+    """
+    按竖线两侧紧邻的内容判断它是框的哪一侧：只有右侧有文字为 'left'（左边界），只有左侧有文字为 'right'，
+    否则（两侧都有或都没有文字，如嵌套框之间的竖线）为 None
+    """
+    text_after = _has_text(_cell_text(line, char_idx + 1).group()) is not None
+    text_before = _has_text(_cell_text_before(line, 0, char_idx).group()) is not None
+    if text_after != text_before:
+        return 'left' if text_after else 'right'
+    return None
+
+
+def _open_corners(lines, idx, display_col, corner_index, row_range, col_range):
+    """
+    CornerIndex.candidates 中其框在 idx 行之前尚未结束的角字符：
+    角字符与 idx 行之间已出现正下方的配对字符（"┐"下方的"┘"、"┌"下方的"└"）时，框已经结束，不再作为目标
+    """
+    options = []
+    for option in corner_index.candidates(idx, display_col, row_range, col_range):
+        col, _, _, corner_row, corner_char_idx = option
+        paired = PAIRED_CORNERS.get(lines[corner_row][corner_char_idx])
+        if paired is None or not any(col == bottom_col for row in range(corner_row + 1, idx)
+                                     for _, bottom_col in tokenize_line(lines[row]).get(paired, ())):
+            options.append(option)
+    return options
+
+def claim_targets(lines, idx, line_targets, corner_index, row_range=DEFAULT_ROW_RANGE, col_range=DEFAULT_COL_RANGE,
+                  corner_row_range=DEFAULT_CORNER_ROW_RANGE, corner_col_range=DEFAULT_CORNER_COL_RANGE):
+    """
+    为一行中的字符重新分配目标角字符（solve 模式）：每个角字符最多分配给一个字符，且保持从左到右的顺序
+    按距离从近到远依次分配，两个字符争同一个角字符时，落选的一个改配到它查找范围内的下一个角字符，而不是直接丢弃
+    - 已在角字符正下方的竖线和"┘"固定在该角字符上，最先分配，不会被改配；"└"占用其正上方的"┌"
+    - 左侧紧接文字的竖线是右边界，优先分配"┐"；右侧紧接文字的是左边界，优先分配"┌"（见 _border_role）
+    - 框已经结束的角字符不作为候选（见 _open_corners）
+    没有可分配的角字符的字符与查找范围内没有角字符时相同，没有目标，不调整也不报告
+    lines / idx: 文档和该行的行号；corner_index: 与 lines 同步的 CornerIndex
+    返回分配后的目标列表（按字符索引升序），目标不是最近的角字符时为新的 AlignTarget
+    """
+    line = lines[idx]
+    # (目标, 显示位置, 候选角字符, 优先的角字符)，"└"只占位，目标为 None
+    items = []
+    for target in line_targets:
+        if target.char_type == '│':
+            options = _open_corners(lines, idx, target.display_pos, corner_index, row_range, col_range)
+            preferred = _BORDER_CORNERS.get(_border_role(line, target.char_idx), '┌╭┐╮')
+        else:
+            options = _open_corners(lines, idx, target.display_pos, corner_index, corner_row_range, corner_col_range)
+            preferred = [corner for corner, paired in PAIRED_CORNERS.items() if paired == target.char_type]
+        items.append((target, target.display_pos, options, preferred))
+    for _, display_col in find_glyph_positions(line, '└╰'):
+        options = [option for option in _open_corners(lines, idx, display_col, corner_index, corner_row_range, 0)
+                   if lines[option[3]][option[4]] in '┌╭']
+        items.append((None, display_col, options, '┌╭'))
+
+    candidates = []
+    for n, (target, display_col, options, preferred) in enumerate(items):
+        for option in options:
+            col, distance = option[0], option[1]
+            pinned = col == display_col and lines[option[3]][option[4]] in preferred
+            mismatched = lines[option[3]][option[4]] not in preferred
+            candidates.append(((not pinned, mismatched, distance, abs(col - display_col), display_col), n, option))
+    candidates.sort(key=operator.itemgetter(0))
+
+    assigned = {}  # 序号 -> 角字符
+    for _, n, option in candidates:
+        if n in assigned:
+            continue
+        display_col, col = items[n][1], option[0]
+        # 角字符未被占用，且与已分配的字符保持相同的左右顺序
+        if all((items[m][1] < display_col) == (other[0] < col) and other[0] != col
+               for m, other in assigned.items()):
+            assigned[n] = option
+
+    claimed = []
+    for n, (target_col, distance, row_offset, target_line_idx, target_char_idx) in assigned.items():
+        target = items[n][0]
+        if target is None:
+            continue
+        if (target_line_idx, target_char_idx) != (target.target_line_idx, target.target_char_idx):
+            target = AlignTarget(target.char_idx, target.display_pos, target_col, distance, row_offset,
+                                 target_line_idx, target_char_idx, target.char_type)
+        claimed.append(target)
+    claimed.sort(key=_by_char_idx)
+    return claimed
+
+def claim_all_targets(lines, targets, corner_index, rows=None, **ranges):
+    """
+    对 targets 中的每一行（rows 不为 None 时只对其中的行）调用 claim_targets
+    返回 {line_idx: [AlignTarget, ...]}（没有分配到目标的行不在其中）
+    """
+    claimed = {}
+    for idx in targets if rows is None else rows:
+        line_targets = targets.get(idx)
+        if not line_targets:
+            continue
+        line_claimed = claim_targets(lines, idx, line_targets, corner_index, **ranges)
+        if line_claimed:
+            claimed[idx] = line_claimed
+    return claimed
+
+def solve_line(line, line_targets, debug=False):
+    """
+    一次性求解一行中所有字符的对齐：从左到右依次调整，并累计前面调整造成的位移
+    line_targets 为 claim_targets 分配后的目标
+    返回: (new_line, widen_requests)
+    widen_requests 为 [(target_line_idx, target_char_idx, amount, char_idx), ...]，
+    表示第 char_idx 个字符偏右且空格不够删除，需要将目标角字符右移 amount 列
+    """
+    shift = 0  # 本行已插入（正）或删除（负）的空格数，插入/删除的都是半角空格，字符位移与显示位移相同
+    widen_requests = []
+    for target in line_targets:
+        char_idx = target.char_idx
+        target_line_idx = target.target_line_idx
+        display_diff = target.target_col - (target.display_pos + shift)
+        if display_diff == 0:
+            continue
+        line, offset = adjust_line_for_pipe(line, char_idx + shift, display_diff, debug=debug)
+        if offset:
+            shift += offset
+        elif display_diff < 0 and target_line_idx is not None:
+            widen_requests.append((target_line_idx, target.target_char_idx, -display_diff, char_idx))
+    return line, widen_requests
+
+def align_lines_solved(lines, *, row_range=DEFAULT_ROW_RANGE, col_range=DEFAULT_COL_RANGE,
+                       corner_row_range=DEFAULT_CORNER_ROW_RANGE, corner_col_range=DEFAULT_CORNER_COL_RANGE,
+                       max_iterations=DEFAULT_MAX_ITERATIONS, backend='auto', extended_glyphs=False, debug=False):
+    """
+    按行求解对齐（不修改传入的 lines）：每行一次性调整所有字符，每行每遍只改写一次
+    需要右移目标角字符时（插入"─"），在一遍结束后统一处理 top_line 和配对的 bottom_line，
+    这些行的其余调整留到下一遍；每个角字符最多右移一次，一遍没有任何改动或文档回到之前某一遍的状态时停止
+    extended_glyphs: 同 find_targets_for_all_lines
+    每遍开始时用 claim_targets 为每行的字符重新分配目标角字符（每个角字符只对应一个字符，保持从左到右的顺序）
+    返回: (aligned_lines, passes, unsatisfied_rows)，unsatisfied_rows 为最终仍有字符未对齐到所分配角字符的行号列表
+    （与 check_document 的结果一致）
+    """
+    ranges = dict(row_range=row_range, col_range=col_range,
+                  corner_row_range=corner_row_range, corner_col_range=corner_col_range)
+    aligned = list(lines)
+    corner_index = CornerIndex(aligned, glyph_roles(extended_glyphs)[0])
+    targets = find_targets_for_all_lines(aligned, corner_index=corner_index, backend=backend,
+                                         extended_glyphs=extended_glyphs, **ranges)
+    corners = glyph_roles(extended_glyphs)[0]
+    changed_rows = set()
+    widened = set()             # 已右移过的角字符 (行号, 该行第几个角字符)，插入"─"和空格不改变序号
+    seen = {tuple(aligned)}     # 各遍结束时的文档，回到之前的状态说明在来回调整
+    claimed = claim_all_targets(aligned, targets, corner_index, **ranges)
+
+    def refresh():
+        # 目标的分配同样只取决于查找范围内的行，只为重新查找了目标的行重新分配
+        dirty_rows = refresh_targets(targets, aligned, changed_rows, corner_index, extended_glyphs=extended_glyphs,
+                                     **ranges)
+        for row in dirty_rows:
+            claimed.pop(row, None)
+        claimed.update(claim_all_targets(aligned, targets, corner_index, rows=dirty_rows, **ranges))
+
+    passes = 0
+    while passes < max_iterations:
+        if passes > 0:
+            refresh()
+        if not find_misaligned_rows(claimed):
+            break
+        passes += 1
+        if debug:
+            print(f"\n====== SOLVING PASS {passes} ======")
+
+        # 逐行求解，每行只改写一次
+        widen_requests = {}
+        for idx in sorted(claimed):
+            new_line, requests = solve_line(aligned[idx], claimed[idx], debug=debug)
+            if new_line != aligned[idx]:
+                if debug:
+                    print(f"[Line {idx+1}] {repr(aligned[idx])} -> {repr(new_line)}")
+                aligned[idx] = new_line
+                changed_rows.add(idx)
+            for target_line_idx, target_char_idx, amount, char_idx in requests:
+                key = (target_line_idx, target_char_idx)
+                max_amount, requesters = widen_requests.get(key, (0, set()))
+                requesters.add((idx, char_idx))
+                widen_requests[key] = (max(amount, max_amount), requesters)
+
+        # 统一右移目标角字符：top_line 的角字符和 bottom_line 中配对的角字符前插入相同数量的"─"
+        # 本遍已改写的行中字符索引已失效，留到下一遍重新查找后再处理
+        insertions = {}
+        for (target_line_idx, target_char_idx), (amount, requesters) in widen_requests.items():
+            if target_line_idx in changed_rows:
+                continue
+            target_line = aligned[target_line_idx]
+            bottom_line_idx, paired_corner_idx = find_paired_corner_in_bottom_line(
+                aligned, target_line_idx, target_line[target_char_idx], target_char_idx
+            )
+            if bottom_line_idx in changed_rows:
+                continue
+            # 同一个角字符再次要求右移时，说明偏右的字符并不属于这个框，继续加宽只会让框越来越宽
+            corner = (target_line_idx, find_glyph_positions(target_line, corners).index(
+                (target_char_idx, display_col_of(target_line, target_char_idx))))
+            if corner in widened:
+                continue
+            widened.add(corner)
+            insertions.setdefault(target_line_idx, {})[target_char_idx] = amount
+            # 偏右的字符本身就是配对的"┘"时只右移 top_line，否则两者同步右移后仍然错位
+            if bottom_line_idx is not None and (bottom_line_idx, paired_corner_idx) not in requesters:
+                insertions.setdefault(bottom_line_idx, {})[paired_corner_idx] = amount
+        for row, row_insertions in insertions.items():
+            line = aligned[row]
+            # 从右向左插入，左侧的字符索引保持有效
+            for char_idx in sorted(row_insertions, reverse=True):
+                line = line[:char_idx] + "─" * row_insertions[char_idx] + line[char_idx:]
+            if debug:
+                print(f"    Widened line {row+1}: {repr(line)}")
+            aligned[row] = line
+            changed_rows.add(row)
+
+        for row in changed_rows:
+            corner_index.update_row(row, aligned[row])
+        if not changed_rows:
+            # 本遍没有任何可执行的调整，继续迭代也不会收敛
+            break
+        state = tuple(aligned)
+        if state in seen:
+            break
+        seen.add(state)
+
+    if passes and changed_rows:
+        refresh()
+    unsatisfied_rows = find_misaligned_rows(claimed)
+    if debug and unsatisfied_rows:
+        print(f"\n警告: 以下行仍有未对齐的字符: {[row + 1 for row in unsatisfied_rows]}")
+    return aligned, passes, unsatisfied_rows
+
+
+# ---------------------------------------
+# 流程框模型：一次解析出所有流程框，按框整体对齐
+# ---------------------------------------
+BOX_GLYPHS = '│┌┐└┘'
+TOP_EDGE_CHARS = '─┬┴┼'  # top_line 中┌与┐之间允许出现的字符
+
+class Box:
+    """
+    流程框：top_line（┌──┐）、左右两侧的竖线和 bottom_line（└──┘）
+    所有列位置均为解析时的显示位置
+    """
+
+    def __init__(self, top_row, left_col, right_col):
+        self.top_row = top_row
+        self.bottom_row = None
+        self.left_col = left_col      # ┌ 的显示位置
+        self.right_col = right_col    # ┐ 的显示位置
+        self.left_pipes = {}          # {row: 左侧竖线的显示位置}
+        self.right_pipes = {}         # {row: 右侧竖线的显示位置}，找不到右侧竖线的行不在其中
+        self.bottom_left_col = None   # └ 的显示位置
+        self.bottom_right_col = None  # ┘ 的显示位置，找不到时为 None
+
+    @property
+    def rows(self):
+        """框内（top_line 与 bottom_line 之间）的行号"""
+        return range(self.top_row + 1, self.bottom_row)
+
+    def contains(self, other):
+        """other 是否嵌套在本框之内"""
+        return (self.top_row < other.top_row and other.bottom_row < self.bottom_row
+                and self.left_col < other.left_col and other.right_col < self.right_col)
+
+    def __repr__(self):
+        return (f"Box(rows={self.top_row + 1}-{self.bottom_row + 1}, "
+                f"cols={self.left_col}-{self.right_col})")
+
+class BoxModel:
+    """
+    流程图模型：所有流程框以及框外的连接线字符（竖线、箭头等）
+    connectors: [(row, display_col, char), ...]
+    """
+
+    def __init__(self, boxes, connectors):
+        self.boxes = boxes
+        self.connectors = connectors
+
+def _row_glyphs(line):
+    """返回行中框线字符的 {显示位置: 字符}（按显示位置升序，来自 tokenize_line）"""
+    tokens = tokenize_line(line)
+    return dict(sorted((col, char) for char in BOX_GLYPHS for _, col in tokens.get(char, ())))
+
+def parse_boxes(lines, side_tolerance=2):
+    """
+    解析文档中的所有流程框
+    top_line 为 ┌──┐（中间可含 ┬┴┼），其下各行依次为"│ │"，直到出现"└ ┘"的 bottom_line 为止；
+    从最下方的 top_line 开始解析，嵌套在内的框先占用自己的框线字符，外层框匹配时跳过它们
+    没有 bottom_line 的（例如分支连接线 ┌──┴──┐）不是流程框
+    返回: BoxModel
+    """
+    glyphs = [_row_glyphs(line) for line in lines]
+    follows = {}  # {行号: 该行与上一行的 _continuations}，匹配时按需计算
+    # 各行已被流程框占用的框线字符 {显示位置: 相对所属框的┌或┐的偏移}，偏移用于估计其右侧内容的整体错位
+    claimed = [{} for _ in lines]
+    boxes = []
+
+    for top_row in range(len(lines) - 1, -1, -1):
+        line = lines[top_row]
+        if '┌' not in line:
+            continue
+        cols = build_column_index(line)
+        spans = []
+        for i, char in enumerate(line):
+            if char != '┌':
+                continue
+            j = i + 1
+            while j < len(line) and line[j] in TOP_EDGE_CHARS:
+                j += 1
+            if j > i + 1 and j < len(line) and line[j] == '┐' and cols[i] not in claimed[top_row]:
+                spans.append((cols[i], cols[j]))
+
+        # 匹配失败的 top_line 逐个剔除后重新匹配同一行的其余框
+        group = None
+        while spans:
+            group, failed = _match_box_group(top_row, spans, glyphs, follows, claimed, side_tolerance)
+            if group is not None:
+                break
+            spans = [span for span in spans if span not in failed]
+        if not group:
+            continue
+
+        for box in group:
+            claimed[top_row].update({box.left_col: 0, box.right_col: 0})
+            claimed[box.bottom_row][box.bottom_left_col] = box.bottom_left_col - box.left_col
+            if box.bottom_right_col is not None:
+                claimed[box.bottom_row][box.bottom_right_col] = box.bottom_right_col - box.right_col
+            for row in box.rows:
+                claimed[row][box.left_pipes[row]] = box.left_pipes[row] - box.left_col
+                claimed[row][box.right_pipes[row]] = box.right_pipes[row] - box.right_col
+        boxes.extend(group)
+
+    boxes.sort(key=lambda b: (b.top_row, b.left_col))
+    connectors = []
+    for row, row_glyphs in enumerate(glyphs):
+        for col, char in row_glyphs.items():
+            if col not in claimed[row]:
+                connectors.append((row, col, char))
+    for row, line in enumerate(lines):
+        if '▼' in line or '▲' in line:
+            cols = build_column_index(line)
+            connectors.extend((row, cols[i], char) for i, char in enumerate(line) if char in '▼▲')
+    connectors.sort()
+    return BoxModel(boxes, connectors)
+
+def _continuations(above, below):
+    """
+    相邻两行框线字符的对应关系：上一行向下延续的字符（│┌┐）与下一行从上方延续而来的字符（│└┘）按从左到右的顺序一一对应，
+    不受文字造成的错位影响；两者个数不同（例如连接线在两行之间开始或结束）时无法确定，返回 None
+    above、below 为 _row_glyphs 的结果
+    返回: {上一行的显示位置: 下一行的显示位置}
+    """
+    down = [col for col, char in above.items() if char in '│┌┐']
+    up = [col for col, char in below.items() if char in '│└┘']
+    if len(down) != len(up):
+        return None
+    return dict(zip(down, up))
+
+def _match_box_group(top_row, spans, glyphs, follows, claimed, side_tolerance):
+    """
+    从 top_row 下一行开始，为同一行起始的一组 top_line（spans 为 [(┌位置, ┐位置), ...]）依次匹配各行的框线字符
+    每行中未被占用的框线字符按从左到右的顺序分配：每个框依次取"│ │"（框内行）或"└ ┘"（bottom_line）
+    上下两行的框线字符能一一对应时（follows 缓存各行与上一行的 _continuations），直接取框的两侧在上一行的字符向下延续到的字符，
+    因此左侧框内的文字（尤其是全角字符）造成的整体错位不影响并排的框；否则按位置匹配：
+    左侧竖线（或└）取与┌相距不超过 side_tolerance 列的最近的一个（┌的位置加上本行左侧最近的已匹配框线字符
+    相对其┌或┐的偏移），外层框的竖线因此不会被当作内框的左边；
+    右侧竖线取其后第一个不在┐（同样加上偏移）左侧 side_tolerance 列以外的竖线，因此框内文字造成的右移不影响匹配；
+    框内文字中的角字符不作为框线
+    返回: (boxes, failed_spans)，有无法匹配的框时 boxes 为 None
+    """
+    boxes = [Box(top_row, left, right) for left, right in spans]
+    open_boxes = boxes
+    failed = []
+    row = top_row + 1
+    while open_boxes and row < len(glyphs):
+        tokens = [(col, char) for col, char in glyphs[row].items() if col not in claimed[row]]
+        if row not in follows:
+            follows[row] = _continuations(glyphs[row - 1], glyphs[row])
+        follow = follows[row]
+        if follow is not None:
+            token_index = {col: i for i, (col, _) in enumerate(tokens)}
+        # 本组在本行已匹配的右侧竖线和┘ [(所属框的┐的位置, 偏移), ...]
+        matched = []
+        k = 0
+        still_open = []
+        for box in open_boxes:
+            left = right = None
+            if follow is not None:
+                # 框的两侧在上一行的显示位置
+                above_left = box.left_pipes.get(row - 1, box.left_col)
+                above_right = box.right_pipes.get(row - 1, box.right_col)
+                left = token_index.get(follow[above_left])
+                right = token_index.get(follow[above_right])
+                if (left is None or right is None or left < k
+                        or tokens[left][1] + tokens[right][1] not in ('││', '└┘')):
+                    left = right = None
+            if left is None:
+                # 本行已匹配的框线字符 [(所属框的┌或┐的位置, 偏移), ...]
+                anchors = sorted([(col - offset, offset) for col, offset in claimed[row].items()] + matched)
+                drift = 0
+                for col, offset in anchors:
+                    if col >= box.left_col:
+                        break
+                    drift = offset
+                # 跳过框左侧的其他字符（例如外层框的竖线或连接线），取离┌最近的竖线或└
+                expected = box.left_col + drift
+                for i in range(k, len(tokens)):
+                    col, char = tokens[i]
+                    if col > expected + side_tolerance:
+                        break
+                    if (col >= expected - side_tolerance and char in '│└'
+                            and (left is None or abs(col - expected) < abs(tokens[left][0] - expected))):
+                        left = i
+                if left is None:
+                    failed.append((box.left_col, box.right_col))
+                    continue
+                if tokens[left][1] == '│':
+                    # 框内文字中可能出现角字符，右侧竖线取其后第一个不在┐左侧太远的竖线
+                    right = left + 1
+                    while right < len(tokens) and (tokens[right][1] != '│'
+                                                   or tokens[right][0] < box.right_col + drift - side_tolerance):
+                        right += 1
+                    if right == len(tokens):
+                        failed.append((box.left_col, box.right_col))
+                        continue
+                elif left + 1 < len(tokens) and tokens[left + 1][1] == '┘':
+                    right = left + 1
+            k = left + 1 if right is None else right + 1
+            if tokens[left][1] == '│':
+                box.left_pipes[row] = tokens[left][0]
+                box.right_pipes[row] = tokens[right][0]
+                still_open.append(box)
+            elif box.left_pipes:
+                box.bottom_row = row
+                box.bottom_left_col = tokens[left][0]
+                if right is not None:
+                    box.bottom_right_col = tokens[right][0]
+            else:
+                failed.append((box.left_col, box.right_col))
+                continue
+            if right is not None:
+                matched.append((box.right_col, tokens[right][0] - box.right_col))
+        open_boxes = still_open
+        row += 1
+    failed.extend((box.left_col, box.right_col) for box in open_boxes)
+    if failed:
+        return None, failed
+    return boxes, []
+
+def move_glyph(line, char_idx, delta, fill=' ', keep_right=True):
+    """
+    将第 char_idx 个字符右移 delta 列（delta < 0 时左移）：在其前面插入或删除 fill 字符
+    keep_right: 为 True 时在该字符之后删除或补充空格，尽量保持右侧内容不动（至少保留一个空格的间隔）
+    返回: (new_line, right_shift)，right_shift 为该字符右侧内容实际移动的列数；
+          左移时前面的 fill 字符不够删除则返回 (None, 0)
+    """
+    if delta > 0:
+        new_line = line[:char_idx] + fill * delta + line[char_idx:]
+    elif delta < 0:
+        run = 0
+        while run < -delta and char_idx - run > 0 and line[char_idx - run - 1] == fill:
+            run += 1
+        if run < -delta:
+            return None, 0
+        new_line = line[:char_idx + delta] + line[char_idx:]
+    else:
+        return line, 0
+
+    glyph_idx = char_idx + delta
+    after = new_line[glyph_idx + 1:]
+    if not keep_right or not after.strip():
+        return new_line, delta
+    if delta > 0:
+        spaces = len(after) - len(after.lstrip(' '))
+        removable = min(delta, max(spaces - 1, 0))
+        new_line = new_line[:glyph_idx + 1] + after[removable:]
+        return new_line, delta - removable
+    new_line = new_line[:glyph_idx + 1] + ' ' * -delta + after
+    return new_line, 0
+
+def align_box_model(lines, model, row_range=DEFAULT_ROW_RANGE, col_range=DEFAULT_COL_RANGE, widened=None,
+                    debug=False):
+    """
+    按流程框整体对齐（原地修改 lines）：
+    1. 按左边界从左到右，将每个框的左侧竖线对齐到┌
+    2. 按右边界从左到右（内层框先于外层框），计算框内文字需要的宽度，
+       必要时在┐前插入"─"加宽整个框，再将右侧竖线和┘对齐到┐
+    3. 含文字的行中，框外的连接竖线对齐到上方 row_range 行、左右 col_range 列内最近的连接线字符
+    widened: 可选的集合，记录已加宽过的框 (top_row, 该行第几个┌)；其中的框不再加宽（由 align_lines_boxes 跨遍传入）
+    返回: (changed_rows, unsatisfied_rows)
+    """
+    # 本遍各行的位移记录 {row: [(解析时的显示位置, 该字符的位移, 其右侧内容的位移), ...]}
+    shifts = {}
+    changed_rows = set()
+    unsatisfied_rows = set()
+
+    def current_col(row, col):
+        now = col
+        for at_col, glyph_delta, right_delta in shifts.get(row, ()):
+            if at_col < col:
+                now += right_delta
+            elif at_col == col:
+                now += glyph_delta
+        return now
+
+    def move(row, col, target_col, fill=' ', keep_right=True):
+        now = current_col(row, col)
+        if now == target_col:
+            return True
+        line = lines[row]
+        char_idx = char_idx_at_display_col(line, now)
+        if char_idx is None:
+            unsatisfied_rows.add(row)
+            return False
+        new_line, right_shift = move_glyph(line, char_idx, target_col - now, fill, keep_right)
+        if new_line is None:
+            if debug:
+                print(f"    Warning: cannot move '{line[char_idx]}' on line {row+1} from col {now} to {target_col}")
+            unsatisfied_rows.add(row)
+            return False
+        if debug:
+            print(f"[Line {row+1}] {repr(line)} -> {repr(new_line)}")
+        # 同一字符可能在本遍内被移动多次，只累计其在解析时位置上的位移
+        shifts.setdefault(row, []).append((col, target_col - now, right_shift))
+        lines[row] = new_line
+        changed_rows.add(row)
+        return True
+
+    def align_left(box):
+        left = current_col(box.top_row, box.left_col)
+        for row, col in box.left_pipes.items():
+            move(row, col, left, keep_right=False)
+        move(box.bottom_row, box.bottom_left_col, left, keep_right=False)
+
+    for box in sorted(model.boxes, key=lambda b: b.left_col):
+        align_left(box)
+
+    # 各框的外层框（由外向内）；model.boxes 按 top_row 排序，只需在尚未结束的框中查找
+    outers = {}
+    active = []
+    for box in model.boxes:
+        active = [other for other in active if other.bottom_row > box.top_row]
+        outers[id(box)] = sorted((other for other in active if other.contains(box)), key=lambda b: b.left_col)
+        active.append(box)
+
+    for box in sorted(model.boxes, key=lambda b: b.right_col):
+        # 左侧邻框的调整可能推动了本框和外层框的左侧竖线，先由外向内重新对齐，再计算框内文字需要的宽度
+        for outer in outers[id(box)]:
+            align_left(outer)
+        align_left(box)
+        right = current_col(box.top_row, box.right_col)
+        needed = right
+        for row, col in box.right_pipes.items():
+            line = lines[row]
+            char_idx = char_idx_at_display_col(line, current_col(row, col))
+            if char_idx is None:
+                continue
+            # 竖线最多左移到框内文字末尾之后
+            content_end = len(line[:char_idx].rstrip(' '))
+            needed = max(needed, build_column_index(line)[content_end])
+        if needed > right and widened is not None:
+            # 同一个框上一遍已经加宽过仍放不下，说明右侧竖线并不属于这个框，继续加宽只会越来越宽
+            top_line = lines[box.top_row]
+            key = (box.top_row, top_line[:char_idx_at_display_col(top_line, current_col(box.top_row, box.left_col))]
+                   .count('┌'))
+            if key in widened:
+                needed = right
+            widened.add(key)
+        if needed > right:
+            if debug:
+                print(f"  Widening {box} by {needed - right}")
+            move(box.top_row, box.right_col, needed, fill='─')
+            right = needed
+        for row, col in box.right_pipes.items():
+            move(row, col, right)
+        if box.bottom_right_col is not None:
+            move(box.bottom_row, box.bottom_right_col, right, fill='─')
+
+    # 文字（尤其是全角字符）使其后的连接竖线错位，按上方的连接线修正
+    connectors_by_row = {}
+    for row, col, char in model.connectors:
+        connectors_by_row.setdefault(row, []).append((col, char))
+    for row, col, char in model.connectors:
+        if char != '│' or not has_text_and_pipe(lines[row]):
+            continue
+        now = current_col(row, col)
+        best = None
+        for row_offset in range(1, row_range + 1):
+            for above_col, above_char in connectors_by_row.get(row - row_offset, ()):
+                if above_char not in '│┐┘┤┬┼▼':
+                    continue
+                above_now = current_col(row - row_offset, above_col)
+                if abs(above_now - now) <= col_range:
+                    distance = abs(above_now - now) + row_offset * 0.5
+                    if best is None or distance < best[0]:
+                        best = (distance, above_now)
+        if best is not None:
+            move(row, col, best[1])
+
+    return changed_rows, sorted(unsatisfied_rows)
+
+def box_misaligned_rows(lines, row_range=DEFAULT_ROW_RANGE, col_range=DEFAULT_COL_RANGE, side_tolerance=2):
+    """
+    box 模式的检查标准：在副本上按流程框模型再对齐一遍，返回会被改动或无法对齐的行号列表（升序）
+    """
+    changed_rows, unsatisfied_rows = align_box_model(list(lines), parse_boxes(lines, side_tolerance),
+                                                     row_range=row_range, col_range=col_range)
+    return sorted(changed_rows.union(unsatisfied_rows))
+
+def align_lines_boxes(lines, *, row_range=DEFAULT_ROW_RANGE, col_range=DEFAULT_COL_RANGE,
+                      max_iterations=DEFAULT_MAX_ITERATIONS, side_tolerance=2, debug=False):
+    """
+    按流程框模型对齐（不修改传入的 lines）：解析出所有流程框后按框整体加宽或收窄，
+    每个框的 top_line、框内各行和 bottom_line 一起调整；通常一遍即可完成，
+    第二遍解析用于确认结果。每个框最多加宽一次，一遍没有改动或文档回到之前某一遍的状态时停止
+    返回: (aligned_lines, passes, unsatisfied_rows)
+    unsatisfied_rows 为 box_misaligned_rows 对结果的检查（与 check_document 一致），
+    包括因已加宽过一次而没有再加宽的框
+    """
+    aligned = list(lines)
+    passes = 0
+    unsatisfied_rows = []
+    widened = set()
+    seen = {tuple(aligned)}
+    while passes < max_iterations:
+        model = parse_boxes(aligned, side_tolerance)
+        if debug:
+            print(f"\n====== BOX PASS {passes + 1}: {len(model.boxes)} boxes ======")
+        changed_rows, unsatisfied_rows = align_box_model(aligned, model, row_range=row_range,
+                                                         col_range=col_range, widened=widened, debug=debug)
+        if not changed_rows:
+            break
+        passes += 1
+        state = tuple(aligned)
+        if state in seen:
+            # 在几种状态之间来回调整，继续迭代也不会收敛
+            break
+        seen.add(state)
+    if passes:
+        # 最后一遍可能受 widened 限制或达到最大遍数，按不受限制的一遍重新确认
+        unsatisfied_rows = box_misaligned_rows(aligned, row_range, col_range, side_tolerance)
+    if debug and unsatisfied_rows:
+        print(f"\n警告: 以下行仍有未对齐的字符: {[row + 1 for row in unsatisfied_rows]}")
+    return aligned, passes, unsatisfied_rows
+
+
+# ---------------------------------------
+# Step 3: 迭代对齐所有含竖线的行
+# ---------------------------------------
+def align_lines(lines, *, row_range=DEFAULT_ROW_RANGE, col_range=DEFAULT_COL_RANGE,
+                corner_row_range=DEFAULT_CORNER_ROW_RANGE, corner_col_range=DEFAULT_CORNER_COL_RANGE,
+                max_iterations=DEFAULT_MAX_ITERATIONS, backend='auto', extended_glyphs=False, debug=False,
+                stats=None):
+    """
+    迭代对齐所有含竖线的行（不修改传入的 lines）
+    backend: 初始查找目标位置使用的后端（见 find_targets_for_all_lines），之后每轮只重算少量行，始终用纯 Python 实现
+    extended_glyphs: 同 find_targets_for_all_lines
+    stats: 可选的 AlignStats，记录查找目标和每轮对齐的耗时及计数
+    返回: (aligned_lines, iterations, has_changes)
+    所有字符初始时都已对齐时 iterations 为 0
+    has_changes 为 True 表示达到最大迭代次数时仍有未对齐的字符
+    """
+    ranges = dict(row_range=row_range, col_range=col_range,
+                  corner_row_range=corner_row_range, corner_col_range=corner_col_range)
+    corners = glyph_roles(extended_glyphs)[0]
+    if stats is not None:
+        started = time.perf_counter()
+    # 角字符索引随每轮的改动增量更新，不再每轮重新扫描；
+    # NumPy 后端的初始查找不使用它，只在需要逐轮调整时才建立
+    use_numpy = not debug and use_numpy_backend(backend, lines)
+    corner_index = None if use_numpy else CornerIndex(lines, corners)
+
+    # 初始查找目标位置
+    if debug:
+        print("====== INITIAL TARGET FINDING ======")
+    targets = find_targets_for_all_lines(lines, debug=debug, corner_index=corner_index,
+                                         backend='numpy' if use_numpy else 'python',
+                                         extended_glyphs=extended_glyphs, **ranges)
+    if debug:
+        print()
+    if stats is not None:
+        stats.add_time('targets', time.perf_counter() - started)
+        if corner_index is None:
+            stats.corners += sum(line.count(corner) for line in lines for corner in corners)
+        else:
+            stats.corners += sum(len(entry[0]) for entry in corner_index.rows if entry is not None)
+        stats.targets += sum(len(line_targets) for line_targets in targets.values())
+
+    # 所有字符都已在目标位置上时不需要任何一轮调整
+    if not find_misaligned_rows(targets):
+        if debug:
+            print("所有竖线已对齐，无需调整。")
+        return list(lines), 0, False
+
+    if corner_index is None:
+        corner_index = CornerIndex(lines, corners)
+    changed_rows = set()
+    # 整个迭代过程只维护一份文档，每轮原地修改
+    doc = FlowchartDocument(lines, corner_index, changed_rows)
+    aligned = doc.rows
+
+    iteration = 0
+    has_changes = True
+
+    while has_changes and iteration < max_iterations:
+        iteration += 1
+
+        # 基于当前对齐结果，只为上一轮改动波及的行重新查找目标位置
+        if iteration > 1:
+            if debug:
+                print(f"\n====== RE-FINDING TARGETS (Round {iteration}) ======")
+            if stats is not None:
+                started = time.perf_counter()
+            refresh_targets(targets, aligned, changed_rows, corner_index, debug=debug,
+                            extended_glyphs=extended_glyphs, **ranges)
+            if stats is not None:
+                stats.add_time('targets', time.perf_counter() - started)
+            if debug:
+                print()
+
+        # 执行一轮对齐
+        if stats is not None:
+            started = time.perf_counter()
+        aligned, has_changes = align_lines_one_round(doc, targets, iteration, debug=debug, stats=stats)
+        if stats is not None:
+            stats.add_round(iteration, time.perf_counter() - started)
+
+        if not has_changes:
+            if debug:
+                print(f"\n所有竖线已对齐，共执行 {iteration} 轮调整。")
+            break
+
+    if iteration >= max_iterations and has_changes:
+        if debug:
+            print(f"\n警告: 达到最大迭代次数 {max_iterations}，可能仍有未对齐的竖线。")
+
+    return aligned, iteration, has_changes
+
+# ---------------------------------------
+# 区域划分：文档中互不影响的流程图分别对齐
+# ---------------------------------------
+_BOX_DRAWING = re.compile('[\u2500-\u257f]').search
+_FENCE = re.compile(r'\s*(```|~~~)').match
+
+
+def find_regions(lines, reach):
+    """
+    将文档划分为互相独立的区域，返回 [(start, end), ...]（行号，左闭右开，按顺序）
+    区域由含制表符（U+2500–U+257F）的行组成；相邻两行制表符行相隔超过 reach 行时，
+    任何查找和改动都跨不过去，分属不同区域。Markdown 代码块的围栏行（``` 或 ~~~）也是区域边界
+    不含制表符的正文行不属于任何区域，对齐时原样保留
+    """
+    regions = []
+    start = last = None
+    for idx, line in enumerate(lines):
+        if _FENCE(line):
+            if start is not None:
+                regions.append((start, last + 1))
+                start = None
+            continue
+        if not _BOX_DRAWING(line):
+            continue
+        if start is not None and idx - last > reach:
+            regions.append((start, last + 1))
+            start = None
+        if start is None:
+            start = idx
+        last = idx
+    if start is not None:
+        regions.append((start, last + 1))
+    return regions
+
+# 字节级预筛选：直接在 UTF-8 字节上查找，不需要先解码和逐行扫描
+BOX_MARKERS = '│┘┐┌'  # 含这些字符的文本才可能需要对齐
+_box_markers = re.compile('[' + BOX_MARKERS + ']').search
+_box_marker_bytes = re.compile(b'|'.join(re.escape(c.encode('utf-8')) for c in BOX_MARKERS)).search
+_box_drawing_bytes = re.compile(rb'\xe2[\x94\x95][\x80-\xbf]').search  # U+2500–U+257F 的 UTF-8 编码
+# str.splitlines() 会断行、但按 b"\n" 计数时不会断行的字符（单独的 \r、\v、\f、\x1c-\x1e、U+0085、U+2028/2029）
+_extra_line_breaks = re.compile(rb'\r(?!\n)|[\x0b\x0c\x1c-\x1e]|\xc2\x85|\xe2\x80[\xa8\xa9]').search
+
+
+def has_box_markers(data):
+    """data（str 或 bytes/mmap 等 UTF-8 字节）中是否含有 BOX_MARKERS 中的字符"""
+    if isinstance(data, str):
+        return _box_markers(data) is not None
+    return _box_marker_bytes(data) is not None
+
+def scan_box_line_ranges(data, reach):
+    """
+    在 UTF-8 字节中查找含制表符的行，按 find_regions 的规则（相隔超过 reach 行即断开）合并为行范围
+    逐个产生 (start_line, end_line, start_byte, end_byte)，行号和字节位置均为左闭右开，字节范围含行尾换行符
+    行按 b"\n" 计数；每个范围都是 find_regions 所得区域的并集（不考虑代码块围栏，只会更大）
+    """
+    line = 0        # pos 处所在的行号
+    pos = 0         # 已计数到的字节位置（总是某一行的行首）
+    current = None  # [start_line, last_line, start_byte, end_byte]
+    size = len(data)
+    match = _box_drawing_bytes(data)
+    while match:
+        hit = match.start()
+        line_start = data.rfind(b'\n', 0, hit) + 1
+        line += data[pos:line_start].count(b'\n')
+        pos = line_start
+        line_end = data.find(b'\n', hit)
+        line_end = size if line_end < 0 else line_end + 1
+        if current is not None and line - current[1] > reach:
+            yield current[0], current[1] + 1, current[2], current[3]
+            current = None
+        if current is None:
+            current = [line, line, line_start, line_end]
+        else:
+            current[1] = line
+            current[3] = line_end
+        # 同一行中的其余制表符不必再看
+        match = _box_drawing_bytes(data, line_end)
+    if current is not None:
+        yield current[0], current[1] + 1, current[2], current[3]
+
+@contextlib.contextmanager
+def map_file(path):
+    """以只读 mmap 打开文件，空文件返回 b''"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b''
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
+def _align_region(lines, options, stats=None):
+    """
+    对齐一个区域内的行（lines 只含该区域）
+    stats: 可选的 AlignStats（solve 和 box 模式只记录整体的对齐耗时和遍数）
+    返回: (aligned_lines, iterations, unaligned_rows)，区域内没有含文字和竖线的行时 iterations 为 None
+    """
+    mode = options['mode']
+    debug = options['debug']
+    max_iterations = options['max_iterations']
+    # 查找目标位置的后端和参与对齐的框线字符
+    engine = dict(backend=options['backend'], extended_glyphs=options['extended_glyphs'])
+    ranges = dict(row_range=options['row_range'], col_range=options['col_range'],
+                  corner_row_range=options['corner_row_range'], corner_col_range=options['corner_col_range'])
+
+    if stats is not None:
+        started = time.perf_counter()
+    pipe_lines = find_pipe_lines(lines)
+    if stats is not None:
+        stats.add_time('scan', time.perf_counter() - started)
+        stats.pipe_lines += len(pipe_lines)
+        stats.pipes += sum(len(pipe_positions) for _, _, pipe_positions in pipe_lines)
+    if not pipe_lines:
+        return lines, None, []
+
+    if debug:
+        print("====== MATCHED LINES (text + │) ======")
+        for idx, line, pipe_positions in pipe_lines:
+            display_positions = [display_pos for _, display_pos in pipe_positions]
+            print(f"Line {idx+1:3d} | display_columns={display_positions} | {repr(line)}")
+        print("=====================================\n")
+
+    if mode != 'iterative':
+        if stats is not None:
+            started = time.perf_counter()
+        if mode == 'solve':
+            result = align_lines_solved(lines, max_iterations=max_iterations, debug=debug, **engine, **ranges)
+        else:
+            result = align_lines_boxes(lines, row_range=ranges['row_range'], col_range=ranges['col_range'],
+                                       max_iterations=max_iterations, debug=debug)
+        if stats is not None:
+            stats.add_time('align', time.perf_counter() - started)
+            stats.add_result(result, max_iterations)
+        return result
+    aligned, iterations, has_changes = align_lines(lines, max_iterations=max_iterations, debug=debug, stats=stats,
+                                                   **engine, **ranges)
+    unaligned_rows = []
+    if iterations:
+        # 提前结束的轮次（某轮没有任何改动）也可能留下错位的字符，与 check_document 使用相同的标准
+        if stats is not None:
+            started = time.perf_counter()
+        unaligned_rows = find_misaligned_rows(find_targets_for_all_lines(aligned, **engine, **ranges))
+        if stats is not None:
+            stats.add_time('targets', time.perf_counter() - started)
+    if stats is not None:
+        stats.add_result((aligned, iterations, unaligned_rows), max_iterations)
+    return aligned, iterations, unaligned_rows
+
+def _align_region_job(job):
+    """
+    进程池中执行的任务：job 为 (lines, options, collect_stats)
+    返回: (_align_region 的结果, AlignStats 或 None)
+    """
+    lines, options, collect_stats = job
+    stats = AlignStats() if collect_stats else None
+    return _align_region(lines, options, stats), stats
+
+# ---------------------------------------
+# 结果缓存：内容未变的区域直接取上次的对齐结果
+# ---------------------------------------
+DEFAULT_CACHE_SIZE = 64 * 1024 * 1024  # 缓存目录的大小上限（字节）
+
+
+def default_cache_dir():
+    """默认缓存目录：$XDG_CACHE_HOME/align-flowchart（Windows 为 %LOCALAPPDATA%\\align-flowchart）"""
+    base = os.environ.get('XDG_CACHE_HOME') or os.environ.get('LOCALAPPDATA') \
+        or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'align-flowchart')
+
+@functools.lru_cache(maxsize=None)
+def _engine_fingerprint():
+    """对齐结果依赖的实现：本模块源码、Unicode 数据库版本和补充的全角范围（宽度策略）"""
+    digest = hashlib.sha256()
+    try:
+        with open(__file__, 'rb') as f:
+            digest.update(f.read())
+    except OSError:
+        pass
+    digest.update(f"{unicodedata.unidata_version}|{_EXTRA_WIDE_RANGES!r}".encode())
+    return digest.hexdigest()
+
+class RegionCache:
+    """
+    按区域内容寻址的磁盘缓存：键为区域文本和对齐参数的 SHA-256，值为该区域的对齐结果
+    每个条目是 directory 下的一个 JSON 文件，命中时更新修改时间，
+    prune() 按修改时间淘汰最久未用的条目，使目录总大小不超过 max_bytes
+    只保存目录和大小上限，可以传给进程池中的子进程
+    """
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_CACHE_SIZE):
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+
+    def key(self, lines, options):
+        """区域文本 + 影响结果的参数 + 实现指纹 的哈希"""
+        params = (options['mode'], options['row_range'], options['col_range'],
+                  options['corner_row_range'], options['corner_col_range'], options['max_iterations'],
+                  options['extended_glyphs'])
+        digest = hashlib.sha256(f"{_engine_fingerprint()}|{params!r}\n".encode())
+        digest.update("\n".join(lines).encode('utf-8', 'surrogatepass'))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.json')
+
+    def get(self, key):
+        """返回 (aligned_lines, iterations, unaligned_rows)，未命中或条目损坏时返回 None"""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            result = entry['text'].split('\n'), entry['iterations'], entry['unaligned_rows']
+            os.utime(path)
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        return result
+
+    def put(self, key, result):
+        aligned, iterations, unaligned_rows = result
+        path = self._path(key)
+        entry = dict(text="\n".join(aligned), iterations=iterations, unaligned_rows=list(unaligned_rows))
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            write_file_atomic(path, json.dumps(entry, ensure_ascii=False))
+        except OSError:
+            # 缓存写入失败不影响对齐结果
+            pass
+
+    def prune(self):
+        """淘汰最久未用的条目直到总大小不超过 max_bytes，返回删除的条目数"""
+        entries = []
+        total = 0
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+class MemoryRegionCache(RegionCache):
+    """
+    常驻内存的区域缓存（供 server 模式使用），键与 RegionCache 相同，按最近使用淘汰，最多保存 max_entries 个区域
+    """
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        self.entries.move_to_end(key)
+        aligned, iterations, unaligned_rows = entry
+        return list(aligned), iterations, list(unaligned_rows)
+
+    def put(self, key, result):
+        aligned, iterations, unaligned_rows = result
+        self.entries[key] = (tuple(aligned), iterations, tuple(unaligned_rows))
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def prune(self):
+        return 0
+
+def align_regions(regions, options, jobs=1, cache=None, stats=None):
+    """
+    对齐多个互相独立的区域（每个区域为行列表），返回各区域的 (aligned_lines, iterations, unaligned_rows)
+    命中缓存的区域直接使用缓存结果，其余区域在 jobs 大于 1 时用进程池并行对齐
+    stats: 可选的 AlignStats，合并各区域的统计（命中缓存的区域计入 cached_regions 和缓存结果中的迭代轮数）
+    """
+    debug = options['debug']
+    if debug:
+        cache = None
+    results = [None] * len(regions)
+    keys = [None] * len(regions)
+    pending = []  # 需要实际对齐的区域序号
+    for i, region in enumerate(regions):
+        if cache is not None:
+            keys[i] = cache.key(region, options)
+            results[i] = cache.get(keys[i])
+        if results[i] is None:
+            pending.append(i)
+
+    if stats is not None:
+        stats.regions += len(regions)
+        for i, result in enumerate(results):
+            if result is not None:
+                stats.cached_regions += 1
+                stats.add_result(result, options['max_iterations'])
+    jobs_args = [(regions[i], options, stats is not None) for i in pending]
+    if jobs > 1 and len(pending) > 1 and not debug:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(jobs, len(pending))) as executor:
+            computed = list(executor.map(_align_region_job, jobs_args))
+    else:
+        computed = [_align_region_job(job) for job in jobs_args]
+    for i, (result, region_stats) in zip(pending, computed):
+        if region_stats is not None:
+            stats.merge(region_stats)
+        results[i] = result
+        if cache is not None:
+            cache.put(keys[i], result)
+    return results
+
+def regions_in_range(regions, line_range):
+    """
+    返回与 line_range（(start, end)，左闭右开，end 为 None 表示到文末）相交的区域；line_range 为 None 时返回全部区域
+    """
+    if line_range is None:
+        return regions
+    range_start, range_end = line_range
+    return [(start, end) for start, end in regions
+            if (range_end is None or start < range_end) and range_start < end]
+
+def parse_line_range(spec):
+    """
+    解析 --lines 的 "START[:END]"（行号从 1 开始，含 END），返回 regions_in_range 使用的 (start, end)；
+    START: 表示到文末，:END 表示从第 1 行开始，只有 START 时只含这一行。格式无效时抛出 ValueError
+    """
+    if not spec:
+        raise ValueError(spec)
+    first, colon, last = spec.partition(':')
+    start = int(first) if first else 1
+    end = int(last) if last else (None if colon else start)
+    if start < 1 or (end is not None and end < start):
+        raise ValueError(spec)
+    return start - 1, end
+
+def align_document(text, *, row_range=DEFAULT_ROW_RANGE, col_range=DEFAULT_COL_RANGE,
+                   corner_row_range=DEFAULT_CORNER_ROW_RANGE, corner_col_range=DEFAULT_CORNER_COL_RANGE,
+                   max_iterations=DEFAULT_MAX_ITERATIONS, mode='iterative', jobs=1, cache=None,
+                   line_range=None, backend='auto', extended_glyphs=False, stats=None, debug=False):
+    """
+    对齐文本中流程图的竖线
+    mode: 'iterative'（逐轮调整每行第一个错位字符）、'solve'（每行一次性求解所有字符，见 align_lines_solved）
+          或 'box'（按流程框整体对齐，见 align_lines_boxes）
+    文档先按 find_regions 划分为互相独立的区域，每个区域单独对齐（正文行不参与查找）
+    jobs: 大于 1 时用多进程并行对齐各区域（debug 时始终串行）
+    cache: 可选的 RegionCache，内容和参数都未变的区域直接使用缓存的结果（debug 时不使用）
+    line_range: 可选的 (start, end) 行号（从 0 开始，左闭右开，end 为 None 表示到文末），
+                只对齐与之相交的区域（自动扩展到整个区域），其余行保证不变
+    backend: 查找目标位置的后端，'auto'（默认，区域较大且已安装 NumPy 时使用 NumPy）、'python' 或 'numpy'，
+             两者结果完全相同
+    extended_glyphs: 为 True 时还对齐"├"、"┤"连接处和圆角框（见 find_targets_for_all_lines；box 模式不使用）
+    stats: 可选的 AlignStats，记录各阶段耗时和计数（见 AlignStats）
+    返回: (result_text, iterations, unaligned_rows)
+    iterations 为各区域中最多的迭代轮数；unaligned_rows 为仍未对齐的行号列表
+    （各模式都与 check_document 对结果的检查一致）
+    若文本中没有含文字和竖线的行，原样返回文本且 iterations 为 None
+    """
+    if mode not in ALIGN_MODES:
+        raise ValueError(f"未知的对齐模式: {mode}")
+    if backend not in TARGET_BACKENDS:
+        raise ValueError(f"未知的后端: {backend}")
+    if stats is not None:
+        started = time.perf_counter()
+    if not has_box_markers(text):
+        # 不含任何框线字符，不必分行扫描
+        if debug:
+            print("No lines with text and vertical line detected, output original text.")
+        if stats is not None:
+            stats.add_time('scan', time.perf_counter() - started)
+        return text, None, []
+
+    lines = text.splitlines()
+    options = dict(row_range=row_range, col_range=col_range,
+                   corner_row_range=corner_row_range, corner_col_range=corner_col_range,
+                   max_iterations=max_iterations, mode=mode, backend=backend, extended_glyphs=extended_glyphs,
+                   debug=debug)
+    # 竖线和"┘"向上查找目标，插入"─"时向下查找配对的 bottom_line，取最大的范围
+    reach = max(row_range, corner_row_range, PAIRED_CORNER_SEARCH_RANGE)
+    regions = regions_in_range(find_regions(lines, reach), line_range)
+    regions = [(start, end) for start, end in regions
+               if any(has_text_and_pipe(line) for line in lines[start:end])]
+    if stats is not None:
+        stats.add_time('scan', time.perf_counter() - started)
+    if not regions:
+        if debug:
+            print("No lines with text and vertical line detected, output original text.")
+        return text, None, []
+
+    results = align_regions([lines[start:end] for start, end in regions], options, jobs=jobs, cache=cache,
+                            stats=stats)
+
+    iterations = None
+    unaligned_rows = []
+    for (start, end), (aligned, region_iterations, region_unaligned) in zip(regions, results):
+        lines[start:end] = aligned
+        if region_iterations is not None:
+            iterations = max(iterations or 0, region_iterations)
+        unaligned_rows.extend(start + row for row in region_unaligned)
+    if stats is None:
+        return "\n".join(lines), iterations, unaligned_rows
+    started = time.perf_counter()
+    result = "\n".join(lines)
+    stats.add_time('output', time.perf_counter() - started)
+    return result, iterations, unaligned_rows
+
+def check_document(text, *, row_range=DEFAULT_ROW_RANGE, col_range=DEFAULT_COL_RANGE,
+                   corner_row_range=DEFAULT_CORNER_ROW_RANGE, corner_col_range=DEFAULT_CORNER_COL_RANGE,
+                   mode='iterative', backend='auto', extended_glyphs=False, line_range=None):
+    """
+    只检查不对齐：扫描一遍各区域，返回竖线"│"或下角标字符"┘"不在目标位置上的行号列表
+    line_range: 同 align_document，只检查与之相交的区域
+    solve 模式检查 claim_targets 为每个字符分配的角字符（与 align_lines_solved 相同），iterative 模式检查最近的角字符；
+    box 模式返回按流程框模型再对齐一遍时会改动或无法对齐的行
+    返回空列表表示文档已经对齐
+    """
+    if mode not in ALIGN_MODES:
+        raise ValueError(f"未知的对齐模式: {mode}")
+    if not has_box_markers(text):
+        return []
+    lines = text.splitlines()
+    ranges = dict(row_range=row_range, col_range=col_range,
+                  corner_row_range=corner_row_range, corner_col_range=corner_col_range)
+    reach = max(row_range, corner_row_range, PAIRED_CORNER_SEARCH_RANGE)
+    misaligned_rows = []
+    for start, end in regions_in_range(find_regions(lines, reach), line_range):
+        region = lines[start:end]
+        if not any(has_text_and_pipe(line) for line in region):
+            continue
+        if mode == 'box':
+            misaligned_rows.extend(start + row for row in box_misaligned_rows(region, row_range, col_range))
+            continue
+        if mode == 'solve':
+            corner_index = CornerIndex(region, glyph_roles(extended_glyphs)[0])
+            targets = find_targets_for_all_lines(region, corner_index=corner_index, backend=backend,
+                                                 extended_glyphs=extended_glyphs, **ranges)
+            targets = claim_all_targets(region, targets, corner_index, **ranges)
+        else:
+            targets = find_targets_for_all_lines(region, backend=backend, extended_glyphs=extended_glyphs, **ranges)
+        misaligned_rows.extend(start + row for row in find_misaligned_rows(targets))
+    return misaligned_rows
+
+def line_edits(old_text, new_text):
+    """
+    返回把 old_text 变为 new_text 的最少行级编辑（按 "\n" 分行）：
+    [{'start': 起始行, 'end': 结束行（不含）, 'lines': 替换成的行}, ...]，行号均为 old_text 中的行号（从 0 开始）
+    """
+    old_lines = old_text.split('\n')
+    new_lines = new_text.split('\n')
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    return [dict(start=i1, end=i2, lines=new_lines[j1:j2])
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+
+def unified_diff(old_text, new_text, path='input', context=3):
+    """返回 old_text 到 new_text 的 unified diff 文本，没有差异时返回空字符串"""
+    diff = difflib.unified_diff(old_text.splitlines(keepends=True), new_text.splitlines(keepends=True),
+                                fromfile=f"a/{path}", tofile=f"b/{path}", n=context)
+    # 末行没有换行符时补上，与 diff 工具的 "\ No newline at end of file" 一致
+    return "".join(line if line.endswith('\n') else line + '\n\\ No newline at end of file\n'
+                   for line in diff)
+
+def align_text(text, **options):
+    """
+    对齐文本中流程图的竖线，返回对齐后的文本
+    options 同 align_document（row_range、col_range、max_iterations 等）
+    """
+    return align_document(text, **options)[0]
+
+
+# ---------------------------------------
+# 流式处理：逐行读取，按区域对齐后立即输出
+# ---------------------------------------
+def align_stream(lines, write, *, row_range=DEFAULT_ROW_RANGE, col_range=DEFAULT_COL_RANGE,
+                 corner_row_range=DEFAULT_CORNER_ROW_RANGE, corner_col_range=DEFAULT_CORNER_COL_RANGE,
+                 max_iterations=DEFAULT_MAX_ITERATIONS, mode='iterative', backend='auto', extended_glyphs=False,
+                 cache=None, stats=None, debug=False):
+    """
+    流式对齐：lines 为逐行产生的文本（可带行尾的 "\n"，如打开的文件对象），结果通过 write 逐段输出
+    区域的划分与 find_regions 相同：正文行立即输出；一个区域在其后出现 reach 行正文（或代码块围栏）时
+    即可确定已经结束，对齐后输出并释放。内存占用只取决于最大的单个区域，与输入总长度无关
+    每行保留原有的行尾，因此输出与输入的行数和末尾换行一致
+    stats: 可选的 AlignStats（读取、划分区域和写出与对齐交替进行，不单独计时）
+    返回: (iterations, unaligned_rows)，含义同 align_document
+    """
+    if mode not in ALIGN_MODES:
+        raise ValueError(f"未知的对齐模式: {mode}")
+    options = dict(row_range=row_range, col_range=col_range,
+                   corner_row_range=corner_row_range, corner_col_range=corner_col_range,
+                   max_iterations=max_iterations, mode=mode, backend=backend, extended_glyphs=extended_glyphs,
+                   debug=debug)
+    reach = max(row_range, corner_row_range, PAIRED_CORNER_SEARCH_RANGE)
+
+    iterations = None
+    unaligned_rows = []
+    region = []        # 当前区域（含区域内的正文行）去掉行尾后的内容
+    endings = []       # 对应的行尾
+    region_start = 0   # 当前区域第一行的行号
+    last_box = None    # 当前区域中最后一个含制表符的行在 region 中的位置
+
+    def flush():
+        """对齐当前区域（到最后一个含制表符的行为止）并输出，其后的正文行原样输出"""
+        nonlocal iterations, last_box
+        body = region[:last_box + 1]
+        if any(has_text_and_pipe(line) for line in body):
+            body, region_iterations, region_unaligned = align_regions([body], options, cache=cache,
+                                                                      stats=stats)[0]
+            if region_iterations is not None:
+                iterations = max(iterations or 0, region_iterations)
+            unaligned_rows.extend(region_start + row for row in region_unaligned)
+        write("".join(line + ending for line, ending in zip(body, endings)))
+        write("".join(line + ending for line, ending in
+                      zip(region[last_box + 1:], endings[last_box + 1:])))
+        region.clear()
+        endings.clear()
+        last_box = None
+
+    for lineno, raw in enumerate(lines):
+        if raw.endswith('\n'):
+            line, ending = raw[:-1], '\n'
+        else:
+            line, ending = raw, ''
+        if _FENCE(line):
+            if last_box is not None:
+                flush()
+            write(raw)
+            continue
+        if _BOX_DRAWING(line):
+            if last_box is None:
+                region_start = lineno
+            region.append(line)
+            endings.append(ending)
+            last_box = len(region) - 1
+        elif last_box is None:
+            write(raw)
+        else:
+            region.append(line)
+            endings.append(ending)
+            if len(region) - 1 - last_box >= reach:
+                # 下一个含制表符的行与本区域相隔已超过 reach 行，属于新的区域
+                flush()
+    if last_box is not None:
+        flush()
+    return iterations, unaligned_rows
+
+
+# ---------------------------------------
+# 批量处理：一次对齐多个文件
+# ---------------------------------------
+DEFAULT_BATCH_PATTERNS = ('*.txt', '*.md')  # 目录中默认处理的文件
+
+
+def collect_input_files(paths, patterns=DEFAULT_BATCH_PATTERNS):
+    """
+    展开文件、目录和通配符，返回去重后的文件路径列表（保持给出的顺序）
+    按 os.path.realpath 去重：以不同写法（./a.txt、目录展开、符号链接）给出的同一个文件只保留第一次出现的路径
+    目录递归查找文件名匹配 patterns 的文件；不存在的路径原样保留，由 align_file 报错
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            found = []
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                found.extend(os.path.join(root, name) for name in sorted(names)
+                             if any(fnmatch.fnmatch(name, pattern) for pattern in patterns))
+            files.extend(found)
+        elif glob.has_magic(path):
+            files.extend(sorted(name for name in glob.glob(path, recursive=True) if os.path.isfile(name)))
+        else:
+            files.append(path)
+    unique = {}
+    for path in files:
+        unique.setdefault(os.path.realpath(path), path)
+    return list(unique.values())
+
+@contextlib.contextmanager
+def atomic_output(path, newline=None):
+    """
+    返回写入同目录下临时文件的文件对象，正常退出时替换 path，出错时原文件保持不变
+    写入的内容与 path 现有内容相同时不替换，避免改变文件的修改时间
+    path 为符号链接时替换其指向的文件，链接本身保持不变；
+    path 存在但不是普通文件（如 /dev/null、/dev/stdout、命名管道）时无法替换，直接写入
+    """
+    if os.path.exists(path) and not os.path.isfile(path):
+        with open(path, 'w', encoding='utf-8', newline=newline) as f:
+            yield f
+        return
+    path = os.path.realpath(path)
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(prefix='.align-', suffix='.tmp', dir=directory)
+    try:
+        with open(fd, 'w', encoding='utf-8', newline=newline) as f:
+            yield f
+        if os.path.exists(path):
+            if filecmp.cmp(tmp_path, path, shallow=False):
+                os.unlink(tmp_path)
+                return
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o7777)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def write_file_atomic(path, text, newline=None):
+    """先写入同目录下的临时文件再替换原文件，写入中途出错时原文件保持不变"""
+    with atomic_output(path, newline=newline) as f:
+        f.write(text)
+
+_CHECK_OPTIONS = ('row_range', 'col_range', 'corner_row_range', 'corner_col_range', 'mode', 'backend',
+                  'extended_glyphs')
+
+
+def align_file(path, in_place=False, check=False, **options):
+    """
+    对齐一个文件，in_place 为 True 且内容有变化时原子替换原文件
+    check 为 True 时只检查（见 check_document），未对齐的行号放在 unaligned_rows 中，changed 表示是否有未对齐的行
+    options 同 align_document；文件保持原有的换行符和末尾换行
+    返回: {'path', 'changed', 'iterations', 'unaligned_rows', 'seconds', 'error'}
+    读取或写入失败时 error 为错误信息，不抛出异常
+    """
+    started = time.perf_counter()
+    summary = dict(path=path, changed=False, iterations=None, unaligned_rows=[], seconds=0.0, error=None)
+    try:
+        # 先在原始字节上预筛选：不含框线字符的文件不解码、不逐行扫描
+        with map_file(path) as data:
+            if not has_box_markers(data):
+                summary['seconds'] = time.perf_counter() - started
+                return summary
+            if check:
+                check_options = {k: v for k, v in options.items() if k in _CHECK_OPTIONS}
+                summary['unaligned_rows'] = check_file_data(data, **check_options)
+                summary['changed'] = bool(summary['unaligned_rows'])
+                summary['seconds'] = time.perf_counter() - started
+                return summary
+        # 批量改写时不替换无法解码的字节，避免损坏非 UTF-8 文件
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+            newline = '\r\n' if f.newlines and '\r\n' in f.newlines else None
+        result, iterations, unaligned_rows = align_document(text, **options)
+        if iterations is not None and text.endswith('\n'):
+            result += '\n'
+        summary.update(changed=result != text, iterations=iterations, unaligned_rows=unaligned_rows)
+        if in_place and summary['changed']:
+            write_file_atomic(path, result, newline=newline)
+    except (OSError, UnicodeDecodeError) as e:
+        summary['error'] = str(e)
+    summary['seconds'] = time.perf_counter() - started
+    return summary
+
+def check_file_data(data, *, row_range=DEFAULT_ROW_RANGE, corner_row_range=DEFAULT_CORNER_ROW_RANGE, **options):
+    """
+    检查文件内容（UTF-8 字节，可以是 mmap）：只解码 scan_box_line_ranges 给出的行范围并逐个检查
+    返回未对齐的行号列表（同 check_document）；解码失败时抛出 UnicodeDecodeError
+    """
+    options.update(row_range=row_range, corner_row_range=corner_row_range)
+    if _extra_line_breaks(data):
+        # 行号计数方式与 splitlines() 不一致，整体解码后检查
+        return check_document(bytes(data).decode('utf-8'), **options)
+    reach = max(row_range, corner_row_range, PAIRED_CORNER_SEARCH_RANGE)
+    misaligned_rows = []
+    for start_line, _, start_byte, end_byte in scan_box_line_ranges(data, reach):
+        text = data[start_byte:end_byte].decode('utf-8')
+        misaligned_rows.extend(start_line + row for row in check_document(text, **options))
+    return misaligned_rows
+
+def _align_file_job(job):
+    """进程池中执行的任务：job 为 (path, in_place, check, options)"""
+    path, in_place, check, options = job
+    return align_file(path, in_place, check, **options)
+
+def align_files(paths, in_place=False, check=False, jobs=1, **options):
+    """
+    批量对齐（或检查）多个文件，jobs 大于 1 时将文件分配到多个进程（每个文件内部不再并行）
+    按 paths 的顺序逐个产生 align_file 的结果
+    """
+    job_args = [(path, in_place, check, options) for path in paths]
+    if jobs > 1 and len(paths) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(jobs, len(paths))) as executor:
+            yield from executor.map(_align_file_job, job_args, chunksize=max(1, len(paths) // (jobs * 8)))
+    else:
+        yield from map(_align_file_job, job_args)
+
+def run_batch(args, jobs, cache=None):
+    """批量模式的命令行入口，逐个输出文件摘要，有文件出错（--check 时有文件未对齐）时返回 1"""
+    files = collect_input_files(args.paths, args.include or DEFAULT_BATCH_PATTERNS)
+    status = 0
+    changed_count = 0
+    for summary in align_files(files, in_place=args.in_place, check=args.check, jobs=jobs, mode=args.mode,
+                               backend=args.backend, extended_glyphs=args.extended_glyphs, cache=cache):
+        if summary['error']:
+            print(f"{summary['path']}: 错误: {summary['error']}", file=sys.stderr)
+            status = 1
+            continue
+        changed_count += summary['changed']
+        if args.check:
+            if summary['unaligned_rows']:
+                rows = ', '.join(str(row + 1) for row in summary['unaligned_rows'])
+                print(f"{summary['path']}: 未对齐的行: {rows}")
+            continue
+        rounds = summary['iterations'] if summary['iterations'] is not None else 0
+        state = '已修改' if summary['changed'] else '未改变'
+        if summary['changed'] and not args.in_place:
+            state = '需修改'
+        print(f"{summary['path']}: {state}，{rounds} 轮，{summary['seconds']:.3f}s")
+        if summary['unaligned_rows']:
+            rows = ', '.join(str(row + 1) for row in summary['unaligned_rows'])
+            print(f"{summary['path']}: 警告: 以下行仍有未对齐的字符: {rows}", file=sys.stderr)
+    if args.check:
+        print(f"共 {len(files)} 个文件，{changed_count} 个未对齐")
+        return 1 if changed_count else status
+    verb = '修改' if args.in_place else '需修改'
+    print(f"共 {len(files)} 个文件，{verb} {changed_count} 个")
+    return status
+
+
+# ---------------------------------------
+# 常驻服务：供编辑器反复调用，避免每次启动解释器
+# ---------------------------------------
+SERVER_OPTIONS = ('mode', 'row_range', 'col_range', 'corner_row_range', 'corner_col_range', 'max_iterations',
+                  'backend', 'extended_glyphs')
+
+
+class ServerError(Exception):
+    """JSON-RPC 错误，code 为 JSON-RPC 错误码"""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+class AlignServer:
+    """
+    JSON-RPC 2.0 服务，每行一个请求、每行一个响应（UTF-8 JSON）
+    方法:
+      align  {text, 选项...}              -> {text, changed, iterations, unaligned_rows}
+                                             指定 range: [start, end] 时只对齐与这些行相交的区域；
+                                             指定 edits: true 时另外返回行级编辑 edits（见 line_edits）
+      check  {text, 选项...}              -> {misaligned_rows}
+      open   {uri, text}                  -> null，保存文档
+      change {uri, text} 或 {uri, edits}  -> null，edits 为 [{start, end, lines}]，用 lines 替换第 start 到 end-1 行
+      format {uri, 选项...}               -> 同 align（指定 edits 时只返回编辑，不含 text），并把结果保存为该文档的新内容
+      close  {uri}                        -> null
+      shutdown                            -> null，处理完本请求后退出
+    选项为 SERVER_OPTIONS 中的参数；文档和区域对齐结果（MemoryRegionCache）在请求之间常驻内存
+    不支持批量请求（JSON 数组），返回 -32600；多个连接共享同一个服务时请求逐个处理（见 serve_socket）
+    """
+
+    def __init__(self, cache=None, **defaults):
+        self.cache = cache if cache is not None else MemoryRegionCache()
+        self.defaults = defaults
+        self.documents = {}
+        self.running = True
+        self.lock = threading.Lock()
+
+    def _options(self, params):
+        options = dict(self.defaults)
+        options.update((name, params[name]) for name in SERVER_OPTIONS if name in params)
+        return options
+
+    def _document(self, params):
+        uri = params.get('uri')
+        if uri not in self.documents:
+            raise ServerError(-32602, f"未打开的文档: {uri}")
+        return uri
+
+    @staticmethod
+    def _text(params):
+        text = params.get('text')
+        if not isinstance(text, str):
+            raise ServerError(-32602, "缺少参数 text")
+        return text
+
+    def _align(self, text, params):
+        line_range = tuple(params['range']) if params.get('range') is not None else None
+        result, iterations, unaligned_rows = align_document(text, cache=self.cache, line_range=line_range,
+                                                            **self._options(params))
+        if iterations is not None and text.endswith('\n'):
+            result += '\n'
+        response = dict(text=result, changed=result != text, iterations=iterations, unaligned_rows=unaligned_rows)
+        if params.get('edits'):
+            response['edits'] = line_edits(text, result)
+        return response
+
+    def rpc_align(self, params):
+        return self._align(self._text(params), params)
+
+    def rpc_check(self, params):
+        options = self._options(params)
+        options.pop('max_iterations', None)
+        line_range = tuple(params['range']) if params.get('range') is not None else None
+        return dict(misaligned_rows=check_document(self._text(params), line_range=line_range, **options))
+
+    @staticmethod
+    def _edits(params):
+        edits = params.get('edits')
+        if not isinstance(edits, list):
+            raise ServerError(-32602, "缺少参数 text 或 edits")
+        for edit in edits:
+            if not (isinstance(edit, dict) and isinstance(edit.get('start'), int) and isinstance(edit.get('end'), int)
+                    and 0 <= edit['start'] <= edit['end'] and isinstance(edit.get('lines'), list)
+                    and all(isinstance(line, str) for line in edit['lines'])):
+                raise ServerError(-32602, f"无效的编辑: {edit!r}（应为 {{start, end, lines}}，lines 为字符串列表）")
+        return edits
+
+    def rpc_open(self, params):
+        uri = params.get('uri')
+        if not isinstance(uri, str):
+            raise ServerError(-32602, "缺少参数 uri")
+        self.documents[uri] = self._text(params)
+
+    def rpc_change(self, params):
+        uri = self._document(params)
+        if 'text' in params:
+            self.documents[uri] = self._text(params)
+            return
+        edits = self._edits(params)
+        lines = self.documents[uri].split('\n')
+        # 从后往前应用，前面的行号不受影响
+        for edit in sorted(edits, key=lambda edit: edit['start'], reverse=True):
+            lines[edit['start']:edit['end']] = edit['lines']
+        self.documents[uri] = '\n'.join(lines)
+
+    def rpc_format(self, params):
+        uri = self._document(params)
+        response = self._align(self.documents[uri], params)
+        self.documents[uri] = response['text']
+        if 'edits' in response:
+            # 编辑器只需应用编辑，不再传回全文
+            del response['text']
+        return response
+
+    def rpc_close(self, params):
+        self.documents.pop(params.get('uri'), None)
+
+    def rpc_shutdown(self, params):
+        self.running = False
+
+    def handle(self, request):
+        """
+        处理一个已解析的请求，返回响应字典；通知（没有 id 的有效请求）返回 None
+        无效的请求（包括批量请求）总是返回 id 为 null 的错误响应
+        """
+        request_id = request.get('id') if isinstance(request, dict) else None
+        try:
+            if isinstance(request, list):
+                raise ServerError(-32600, "无效的请求：不支持批量请求")
+            if not isinstance(request, dict) or not isinstance(request.get('method'), str):
+                raise ServerError(-32600, "无效的请求")
+            handler = getattr(self, 'rpc_' + request['method'], None)
+            if handler is None:
+                raise ServerError(-32601, f"未知的方法: {request['method']}")
+            params = request.get('params') or {}
+            if not isinstance(params, dict):
+                raise ServerError(-32602, "params 必须是对象")
+            try:
+                result = handler(params)
+            except (KeyError, TypeError, ValueError, IndexError) as e:
+                raise ServerError(-32602, f"参数错误: {e}")
+        except ServerError as e:
+            if e.code == -32600:
+                request_id = None
+            elif 'id' not in request:
+                return None
+            return dict(jsonrpc='2.0', id=request_id, error=dict(code=e.code, message=str(e)))
+        if 'id' not in request:
+            return None
+        return dict(jsonrpc='2.0', id=request_id, result=result)
+
+    def handle_line(self, line):
+        """处理一行 JSON 文本，返回响应的 JSON 文本（不含换行），不需要响应时返回 None"""
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            response = dict(jsonrpc='2.0', id=None, error=dict(code=-32700, message=f"JSON 解析错误: {e}"))
+        else:
+            with self.lock:
+                response = self.handle(request)
+        return None if response is None else json.dumps(response, ensure_ascii=False)
+
+    def serve(self, infile, outfile):
+        """从 infile 逐行读取请求，响应写入 outfile，直到输入结束或收到 shutdown"""
+        for line in infile:
+            if not line.strip():
+                continue
+            response = self.handle_line(line)
+            if response is not None:
+                outfile.write(response + '\n')
+                outfile.flush()
+            if not self.running:
+                break
+
+def serve_socket(server, host, port):
+    """
+    在本地 TCP 端口上提供服务，每个连接一个线程，所有连接共享文档和缓存（请求由 server.lock 逐个处理）
+    任一连接发出 shutdown 后停止接受新连接并返回
+    """
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            infile = io.TextIOWrapper(self.rfile, encoding='utf-8')
+            outfile = io.TextIOWrapper(self.wfile, encoding='utf-8', write_through=True)
+            server.serve(infile, outfile)
+            if not server.running:
+                # 在连接线程中调用，serve_forever 所在的线程随后返回
+                self.server.shutdown()
+
+    with socketserver.ThreadingTCPServer((host, port), Handler) as tcp_server:
+        tcp_server.daemon_threads = True
+        tcp_server.serve_forever()
+
+
+# ---------------------------------------
+# 命令行入口
+# ---------------------------------------
+def write_stats(stats, destination, **info):
+    """将统计结果以 JSON 写入 destination（'-' 表示标准错误），info 为附加的字段（如输入文件、模式）"""
+    report = dict(info, **stats.as_dict())
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if destination == '-':
+        print(text, file=sys.stderr)
+        return
+    with open(destination, 'w', encoding='utf-8') as f:
+        f.write(text + '\n')
+
+def run_stream(args, cache=None, stats=None):
+    """流式模式的命令行入口：从文件或标准输入逐行读取，写入输出文件（先写临时文件）或标准输出"""
+    try:
+        if args.input is None or args.input == '-':
+            infile = contextlib.nullcontext(sys.stdin)
+        else:
+            infile = open(args.input, 'r', encoding='utf-8', errors='replace')
+        with infile as f_in:
+            if args.output:
+                with atomic_output(args.output) as f_out:
+                    iterations, unaligned_rows = align_stream(f_in, f_out.write, mode=args.mode,
+                                                              backend=args.backend,
+                                                              extended_glyphs=args.extended_glyphs,
+                                                              cache=cache, stats=stats, debug=args.debug)
+            else:
+                iterations, unaligned_rows = align_stream(f_in, sys.stdout.write, mode=args.mode,
+                                                          backend=args.backend,
+                                                          extended_glyphs=args.extended_glyphs,
+                                                          cache=cache, stats=stats, debug=args.debug)
+    except OSError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return 1
+    if unaligned_rows:
+        print(f"警告: 以下行仍有未对齐的字符: {', '.join(str(row + 1) for row in unaligned_rows)}", file=sys.stderr)
+    return 0
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="对齐流程图中的竖线")
+    parser.add_argument("paths", nargs="*",
+                        help="批量模式：要对齐的文件、目录或通配符（如 'docs/**/*.md'），输出每个文件的摘要")
+    parser.add_argument("--input", "-i", type=str, default=None,
+                        help="输入文件路径（使用 '-' 或留空表示从标准输入读取）")
+    parser.add_argument("--output", "-o", type=str, default=None,
+                        help="输出文件路径（默认: 输出到标准输出）")
+    parser.add_argument("--mode", choices=ALIGN_MODES, default='iterative',
+                        help="对齐模式：iterative 逐轮调整每行第一个错位字符（默认）；"
+                             "solve 每行一次性求解所有字符，每个角字符最多右移一次；"
+                             "box 按流程框整体加宽或收窄")
+    parser.add_argument("--backend", choices=TARGET_BACKENDS, default='auto',
+                        help="查找目标位置的后端：auto 较大的流程图在已安装 NumPy 时使用 NumPy（默认）；"
+                             "python 纯 Python 实现；numpy 始终使用 NumPy（未安装时回退到纯 Python），结果完全相同")
+    parser.add_argument("--extended-glyphs", action="store_true",
+                        help="同时对齐 ├ ┤ 连接处和圆角框（╭╮╰╯），竖线也可对齐到 ┬（iterative 和 solve 模式）")
+    parser.add_argument("--lines", type=str, default=None, metavar="START[:END]",
+                        help="只对齐（或 --check 只检查）包含这些行（从 1 开始，含 END；START: 表示到文末）的流程图区域，"
+                             "其余行保持不变")
+    parser.add_argument("--output-format", choices=('text', 'edits', 'diff'), default='text',
+                        help="输出格式：text 完整文本（默认）；edits 行级编辑的 JSON 列表；diff unified diff")
+    parser.add_argument("--server", action="store_true",
+                        help="常驻服务模式：在标准输入/输出上处理 JSON-RPC 请求（每行一个），缓存在请求之间保留")
+    parser.add_argument("--server-port", type=int, default=None, metavar="PORT",
+                        help="常驻服务模式：改为监听 127.0.0.1 上的 TCP 端口")
+    parser.add_argument("--check", action="store_true",
+                        help="只检查不修改：输出未对齐的行号，有未对齐的行时退出码为 1")
+    parser.add_argument("--stream", action="store_true",
+                        help="流式处理：逐行读取，每个流程图区域对齐后立即输出，内存占用与输入大小无关")
+    parser.add_argument("--in-place", action="store_true",
+                        help="批量模式：将结果写回原文件（先写临时文件再替换）；不指定时只报告哪些文件需要修改")
+    parser.add_argument("--include", action="append", metavar="PATTERN",
+                        help="批量模式：目录中要处理的文件名通配符，可重复指定（默认: *.txt 和 *.md）")
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        help="并行进程数：批量模式下并行处理多个文件，否则并行对齐各独立区域"
+                             "（默认: 1，即不使用多进程；0 表示使用全部 CPU）")
+    parser.add_argument("--cache", action="store_true",
+                        help="缓存每个区域的对齐结果，内容和参数都未变的区域不再重新对齐")
+    parser.add_argument("--cache-dir", type=str, default=None,
+                        help="缓存目录（指定时自动启用缓存；默认: $XDG_CACHE_HOME/align-flowchart）")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE // (1024 * 1024), metavar="MB",
+                        help="缓存目录的大小上限，超出时淘汰最久未用的条目（默认: %(default)s MB）")
+    parser.add_argument("--stats", nargs="?", const="-", default=None, metavar="FILE",
+                        help="将各阶段耗时、迭代轮数和调整计数以 JSON 写入 FILE（不指定 FILE 时写入标准错误）")
+    parser.add_argument("--debug", action="store_true", help="显示调试信息")
+    return parser
+
+def main(argv=None):
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    cache = None
+    if args.cache or args.cache_dir:
+        cache = RegionCache(args.cache_dir, max_bytes=args.cache_size * 1024 * 1024)
+
+    try:
+        return _main(parser, args, jobs, cache)
+    finally:
+        if cache is not None:
+            cache.prune()
+
+def _main(parser, args, jobs, cache):
+    if args.server or args.server_port is not None:
+        server = AlignServer(cache=cache, mode=args.mode, backend=args.backend,
+                             extended_glyphs=args.extended_glyphs)
+        if args.server_port is not None:
+            serve_socket(server, '127.0.0.1', args.server_port)
+        else:
+            server.serve(sys.stdin, sys.stdout)
+        return 0
+    if args.paths:
+        if args.input is not None or args.output:
+            parser.error("批量模式不能与 --input/--output 同时使用")
+        if args.stats:
+            parser.error("--stats 不能用于批量模式")
+        if args.lines is not None:
+            parser.error("--lines 不能用于批量模式")
+        return run_batch(args, jobs, cache)
+    line_range = None
+    if args.lines is not None:
+        try:
+            line_range = parse_line_range(args.lines)
+        except ValueError:
+            parser.error(f"无效的行范围: {args.lines}")
+    if line_range is not None and args.stream:
+        parser.error("--lines 不能与 --stream 同时使用")
+    if args.check and (args.in_place or args.output or args.stream):
+        parser.error("--check 不能与 --in-place/--output/--stream 同时使用")
+    if args.in_place:
+        parser.error("--in-place 只能用于批量模式")
+    if args.check and args.stats:
+        parser.error("--stats 不能与 --check 同时使用")
+    # 不指定 --stats 时不做任何计时和计数
+    stats = AlignStats() if args.stats else None
+    if stats is not None:
+        started = time.perf_counter()
+    if args.stream:
+        status = run_stream(args, cache, stats)
+        if stats is not None and status == 0:
+            write_stats(stats, args.stats, input=args.input or 'stdin', mode=args.mode, stream=True,
+                        total_seconds=time.perf_counter() - started)
+        return status
+
+    # 从文件或标准输入读取输入
+    if args.input is None or args.input == '-':
+        # 从标准输入读取
+        if args.debug:
+            print("从标准输入读取...", file=sys.stderr)
+        try:
+            text_raw = sys.stdin.read()
+        except Exception as e:
+            print(f"错误: 无法从标准输入读取: {e}", file=sys.stderr)
+            return 1
+    else:
+        # 从文件读取
+        input_file = args.input
+        if not os.path.exists(input_file):
+            print(f"错误: 文件不存在: {input_file}", file=sys.stderr)
+            return 1
+
+        try:
+            with open(input_file, 'r', encoding='utf-8', errors='replace') as f:
+                text_raw = f.read()
+        except Exception as e:
+            print(f"错误: 无法读取文件 {input_file}: {e}", file=sys.stderr)
+            return 1
+
+    if stats is not None:
+        stats.add_time('read', time.perf_counter() - started)
+
+    if args.check:
+        misaligned_rows = check_document(text_raw, mode=args.mode, backend=args.backend,
+                                         extended_glyphs=args.extended_glyphs, line_range=line_range)
+        if misaligned_rows:
+            print(f"未对齐的行: {', '.join(str(row + 1) for row in misaligned_rows)}")
+            return 1
+        return 0
+
+    if args.debug:
+        print("====== RAW INPUT ======")
+        print(text_raw)
+        print("========================\n")
+
+    result, iterations, unaligned_rows = align_document(text_raw, mode=args.mode, backend=args.backend,
+                                                        extended_glyphs=args.extended_glyphs, jobs=jobs,
+                                                        cache=cache, line_range=line_range, stats=stats,
+                                                        debug=args.debug)
+    # 若无匹配行，原文原样输出（不追加换行）
+    unchanged = iterations is None
+    # 保留原文末尾换行的结果，--stats 的 changed 按它与原文比较
+    restored = result + '\n' if not unchanged and text_raw.endswith('\n') else result
+    changed = restored != text_raw
+    if args.output or args.output_format != 'text':
+        # 写入文件时与 align_file 一致地保留原文末尾的换行，已对齐的文件因此不会被改写；
+        # 编辑和 diff 也按保留末尾换行的结果计算，只包含真正改变的行
+        result = restored
+    if args.output_format != 'text':
+        if args.output_format == 'edits':
+            result = json.dumps(line_edits(text_raw, result), ensure_ascii=False)
+        else:
+            result = unified_diff(text_raw, result, path=args.input or 'stdin')
+        unchanged = args.output_format == 'diff'
+
+    if unaligned_rows:
+        print(f"警告: 以下行仍有未对齐的字符: {', '.join(str(row + 1) for row in unaligned_rows)}", file=sys.stderr)
+
+    if args.debug and not unchanged:
+        print("====== FINAL OUTPUT ======")
+        print(result)
+        print("==========================")
+
+    # 输出结果（内容与输出文件现有内容相同时不改写）
+    if stats is not None:
+        write_started = time.perf_counter()
+    if args.output:
+        try:
+            with atomic_output(args.output) as f:
+                f.write(result)
+            if args.debug:
+                print(f"\n结果已保存到: {args.output}")
+        except Exception as e:
+            print(f"错误: 无法写入文件 {args.output}: {e}", file=sys.stderr)
+            return 1
+    else:
+        print(result, end="" if unchanged else "\n")
+    if stats is not None:
+        stats.add_time('write', time.perf_counter() - write_started)
+        write_stats(stats, args.stats, input=args.input or 'stdin', mode=args.mode, lines=len(text_raw.splitlines()),
+                    changed=changed, unaligned_rows=len(unaligned_rows),
+                    total_seconds=time.perf_counter() - started)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
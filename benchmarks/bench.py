@@ -0,0 +1,418 @@
+"""
+align_flowchart 性能测试
+
+- 合成流程图生成器：框数量、嵌套深度、行宽、汉字比例、错位框数量均可单独调整
+- 按阶段计时：区域划分、竖线查找（Step 1）、目标查找（Step 2）、迭代对齐（Step 3）、输出
+- 用仓库中的示例文件做 golden 对比，输出必须与 benchmarks/golden/ 中保存的结果一致
+- 与 benchmarks/baseline.json 中保存的基线对比，某阶段明显变慢或输出改变时返回非零退出码
+- 差分测试（见 difftest.py）：随机流程图在参照算法和各优化实现下的输出必须逐字节相同
+
+用法:
+    python benchmarks/bench.py                    # 运行并与基线对比
+    python benchmarks/bench.py --save-baseline    # 运行并保存为新的基线
+    python benchmarks/bench.py --update-golden    # 重新生成 golden 输出
+    python benchmarks/bench.py --differential 500 # 差分测试使用 500 个随机用例（0 表示跳过）
+    python benchmarks/bench.py --generate boxes=50,depth=2,cjk=0.8 > sample.txt
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+import align_flowchart as af  # noqa: E402
+
+GOLDEN_DIR = os.path.join(BENCH_DIR, 'golden')
+BASELINE_PATH = os.path.join(BENCH_DIR, 'baseline.json')
+FIXTURES = ('flowchart1.txt', 'flowchart2.txt', 'flowchart3.txt')
+STAGES = ('split', 'regions', 'pipes', 'targets', 'align', 'output')
+NOISE_FLOOR = 0.02  # 基线耗时低于 20 毫秒的阶段不做回归比较，更短的阶段受调度和缓存影响，波动常超过 1.5 倍
+
+
+# ---------------------------------------
+# 合成流程图生成器
+# ---------------------------------------
+CJK_CHARS = "流程图数据模块处理输入输出对齐竖线检查文件参数调用结果配置缓存索引"
+ASCII_CHARS = "abcdefghijklmnopqrstuvwxyz_()-/0123456789"
+
+
+def _text(rng, width, cjk_ratio):
+    """生成显示宽度不超过 width 的文字"""
+    chars = []
+    used = 0
+    target = rng.randint(max(1, width // 3), width)
+    while True:
+        char = rng.choice(CJK_CHARS) if rng.random() < cjk_ratio else rng.choice(ASCII_CHARS)
+        char_width = af.char_width(char)
+        if used + char_width > target:
+            break
+        chars.append(char)
+        used += char_width
+    return "".join(chars), used
+
+def _render_box(rng, width, depth, rows, cjk_ratio, misaligned):
+    """
+    生成一个内宽为 width 的流程框（含 depth-1 层嵌套的内框），返回行列表
+    misaligned 为 True 时像大模型生成的文本一样按字符数而不是显示宽度补空格，并随机多补或少补几个空格
+    """
+    lines = ["┌" + "─" * width + "┐"]
+
+    def row(content, content_width):
+        pad = width - content_width
+        if misaligned:
+            pad = width - len(content) + rng.choice((-2, -1, 0, 1, 2))
+        lines.append("│" + content + " " * max(0, pad) + "│")
+
+    for _ in range(rows):
+        text, used = _text(rng, width - 2, cjk_ratio)
+        row(" " + text, used + 1)
+    if depth > 1 and width > 8:
+        inner = _render_box(rng, width - 4, depth - 1, rows, cjk_ratio, misaligned)
+        for inner_line in inner:
+            row(" " + inner_line, 1 + af.line_display_width(inner_line))
+    bottom = width + (rng.choice((-2, -1, 1, 2)) if misaligned else 0)
+    lines.append("└" + "─" * bottom + "┘")
+    return lines
+
+def generate_flowchart(boxes=10, depth=1, width=30, cjk_ratio=0.5, misaligned=3, columns=1, rows=3, seed=0):
+    """
+    生成合成流程图文本
+    boxes: 框的数量（不含嵌套的内框），每 columns 个并排为一层，层与层之间用"│"和"▼"连接
+    depth: 嵌套深度（1 表示没有内框）
+    width: 最外层框的内宽（显示宽度）
+    cjk_ratio: 文字中汉字的比例（0–1）
+    misaligned: 故意错位的框的数量
+    rows: 每个框（每层嵌套）中的文字行数
+    """
+    rng = random.Random(seed)
+    broken = set(rng.sample(range(boxes), min(misaligned, boxes)))
+    lines = []
+    for first in range(0, boxes, columns):
+        group = [_render_box(rng, width, depth, rows, cjk_ratio, index in broken)
+                 for index in range(first, min(first + columns, boxes))]
+        height = max(len(box) for box in group)
+        for r in range(height):
+            parts = [box[r] if r < len(box) else " " * af.line_display_width(box[0]) for box in group]
+            lines.append("   ".join(parts).rstrip())
+        lines.append(" " * (width // 2) + "│")
+        lines.append(" " * (width // 2) + "▼")
+    return "\n".join(lines)
+
+def parse_generator_spec(spec):
+    """解析 "boxes=50,depth=2,cjk=0.8" 形式的生成参数"""
+    names = dict(cjk='cjk_ratio')
+    params = {}
+    for item in filter(None, spec.split(',')):
+        name, _, value = item.partition('=')
+        name = names.get(name.strip(), name.strip())
+        params[name] = float(value) if name == 'cjk_ratio' else int(value)
+    return params
+
+# 各场景只改变一个参数，便于定位哪个维度变慢
+# 注意：deep（多层嵌套框）和 side-by-side（并排框）在 iterative 模式下会达到最大迭代次数，
+# 输出并不是正确对齐的结果；这两个场景只用于计时，基线中的哈希记录的是当前算法的实际输出
+SCENARIOS = {
+    'base':        dict(boxes=40, depth=1, width=30, cjk_ratio=0.5, misaligned=10),
+    'many-boxes':  dict(boxes=400, depth=1, width=30, cjk_ratio=0.5, misaligned=100),
+    'deep':        dict(boxes=40, depth=4, width=60, cjk_ratio=0.5, misaligned=10),
+    'wide':        dict(boxes=40, depth=1, width=200, cjk_ratio=0.5, misaligned=10),
+    'cjk-heavy':   dict(boxes=40, depth=1, width=30, cjk_ratio=0.95, misaligned=10),
+    'ascii-only':  dict(boxes=40, depth=1, width=30, cjk_ratio=0.0, misaligned=10),
+    'all-broken':  dict(boxes=40, depth=1, width=30, cjk_ratio=0.5, misaligned=40),
+    'aligned':     dict(boxes=40, depth=1, width=30, cjk_ratio=0.5, misaligned=0),
+    'side-by-side': dict(boxes=120, depth=1, width=30, cjk_ratio=0.5, misaligned=30, columns=3),
+}
+
+
+# ---------------------------------------
+# 分阶段计时
+# ---------------------------------------
+def time_stages(text):
+    """
+    按阶段运行 iterative 模式并计时（与 align_document 的处理顺序相同）
+    返回: ({阶段: 秒}, 结果文本, 最多轮数)
+    """
+    ranges = dict(row_range=af.DEFAULT_ROW_RANGE, col_range=af.DEFAULT_COL_RANGE,
+                  corner_row_range=af.DEFAULT_CORNER_ROW_RANGE, corner_col_range=af.DEFAULT_CORNER_COL_RANGE)
+    reach = max(af.DEFAULT_ROW_RANGE, af.DEFAULT_CORNER_ROW_RANGE, af.PAIRED_CORNER_SEARCH_RANGE)
+    times = {}
+
+    t = time.perf_counter()
+    lines = text.splitlines()
+    times['split'] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    regions = af.find_regions(lines, reach)
+    times['regions'] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    for start, end in regions:
+        af.find_pipe_lines(lines[start:end])
+    times['pipes'] = time.perf_counter() - t
+    regions = [(start, end) for start, end in regions
+               if any(af.has_text_and_pipe(line) for line in lines[start:end])]
+
+    t = time.perf_counter()
+    for start, end in regions:
+        af.find_targets_for_all_lines(lines[start:end], **ranges)
+    times['targets'] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    rounds = 0
+    for start, end in regions:
+        aligned, iterations, _ = af.align_lines(lines[start:end], **ranges)
+        lines[start:end] = aligned
+        rounds = max(rounds, iterations)
+    times['align'] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    result = "\n".join(lines)
+    times['output'] = time.perf_counter() - t
+    return times, result, rounds
+
+def calibrate(repeat=5):
+    """
+    与 align_flowchart 无关的固定纯 Python 负载（字符串处理和字典操作），取最小耗时
+    与基线中保存的值相比得到机器当前的快慢，比较耗时前先按此比例换算基线
+    """
+    words = [f"{i:05d}流程图{i % 97}" for i in range(20000)]
+    best = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        counts = {}
+        for word in words:
+            key = word[-2:]
+            counts[key] = counts.get(key, 0) + len(word.split("图"))
+        "".join(sorted(words, key=len))
+        elapsed = time.perf_counter() - t
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def run_scenario(text, repeat):
+    """
+    重复 repeat 次，各阶段取最小值（受其他进程干扰最少，比中位数稳定）；同时检查分阶段结果与 align_document 一致
+    每次重复前运行一次 calibrate()，calibration 为其最小耗时，与该场景的计时处于相同的机器负载下
+    """
+    samples = {stage: [] for stage in STAGES}
+    totals = {mode: [] for mode in af.ALIGN_MODES}
+    calibrations = []
+    for _ in range(repeat):
+        calibrations.append(calibrate(repeat=1))
+        times, result, rounds = time_stages(text)
+        for stage in STAGES:
+            samples[stage].append(times[stage])
+        for mode in af.ALIGN_MODES:
+            t = time.perf_counter()
+            mode_result = af.align_text(text, mode=mode)
+            totals[mode].append(time.perf_counter() - t)
+            if mode == 'iterative' and mode_result != result and af.has_box_markers(text):
+                raise AssertionError("分阶段计时的结果与 align_document 不一致")
+    return dict(
+        stages={stage: min(values) for stage, values in samples.items()},
+        modes={mode: min(values) for mode, values in totals.items()},
+        calibration=min(calibrations),
+        rounds=rounds,
+        lines=len(text.splitlines()),
+        output_sha256=hashlib.sha256(result.encode('utf-8')).hexdigest(),
+    )
+
+def merge_results(old, new):
+    """合并同一场景两次运行的结果，各阶段和模式的耗时以及 calibration 取较小值"""
+    merged = dict(new, calibration=min(old['calibration'], new['calibration']))
+    for group in ('stages', 'modes'):
+        merged[group] = {key: min(seconds, old[group][key]) for key, seconds in new[group].items()}
+    return merged
+
+
+# ---------------------------------------
+# golden 对比
+# ---------------------------------------
+def read_fixture(path):
+    """示例文件按 UTF-8 读取，不是 UTF-8 时按 GB18030 读取（flowchart3.txt 为 GBK 编码）"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return data.decode('gb18030')
+
+def golden_path(name, mode):
+    return os.path.join(GOLDEN_DIR, f"{os.path.splitext(name)[0]}.{mode}.txt")
+
+# 由生成器得到的 golden 输入：已对齐的多层嵌套框（solve 和 box 模式必须原样输出）和错位的嵌套框
+GENERATED_FIXTURES = {
+    'nested.txt': dict(boxes=4, depth=3, width=40, cjk_ratio=0.5, misaligned=0, columns=2, seed=1),
+    'nested-broken.txt': dict(boxes=4, depth=3, width=40, cjk_ratio=0.5, misaligned=4, columns=2, seed=2),
+}
+
+def golden_inputs():
+    """依次返回 (名称, 文本)：仓库中的示例文件，以及 GENERATED_FIXTURES 生成的流程图"""
+    for name in FIXTURES:
+        yield name, read_fixture(os.path.join(REPO_DIR, name))
+    for name, params in GENERATED_FIXTURES.items():
+        yield name, generate_flowchart(**params)
+
+def check_golden(update=False):
+    """对比每个 golden 输入在各模式下的输出与 golden 文件，返回不一致的列表"""
+    failures = []
+    for name, text in golden_inputs():
+        if name == 'nested.txt':
+            for mode in ('solve', 'box'):
+                if af.align_text(text, mode=mode) != text:
+                    failures.append(f"{name} ({mode}): 已对齐的嵌套框被改动")
+        for mode in af.ALIGN_MODES:
+            result = af.align_text(text, mode=mode)
+            path = golden_path(name, mode)
+            if update:
+                with open(path, 'w', encoding='utf-8', newline='') as f:
+                    f.write(result)
+                continue
+            try:
+                with open(path, 'r', encoding='utf-8', newline='') as f:
+                    expected = f.read()
+            except OSError:
+                failures.append(f"{name} ({mode}): 缺少 golden 文件 {os.path.relpath(path, REPO_DIR)}")
+                continue
+            if result != expected:
+                failures.append(f"{name} ({mode}): 输出与 golden 不一致")
+    return failures
+
+
+# ---------------------------------------
+# 基线对比
+# ---------------------------------------
+def compare_baseline(results, baseline, tolerance, calibration=None):
+    """
+    返回回归列表：输出的哈希或轮数改变，或某阶段 / 模式的耗时超过基线的 tolerance 倍
+    calibration 与基线都记录了 calibrate() 的耗时时，基线耗时先乘以两者之比，抵消机器整体变快或变慢；
+    场景本身与基线中的该场景都记录了 calibration 时，改用场景各自的比值（与计时交替测得，更能反映当时的负载）
+    耗时很短（基线小于 NOISE_FLOOR 秒）的阶段波动较大，不参与比较
+    """
+    regressions = []
+    scale = 1.0
+    if calibration and baseline.get('calibration'):
+        scale = calibration / baseline['calibration']
+    for name, result in results.items():
+        old = baseline.get('scenarios', {}).get(name)
+        if old is None:
+            continue
+        scenario_scale = scale
+        if result.get('calibration') and old.get('calibration'):
+            scenario_scale = result['calibration'] / old['calibration']
+        if result['output_sha256'] != old['output_sha256']:
+            regressions.append(f"{name}: 输出改变")
+        if result['rounds'] != old['rounds']:
+            regressions.append(f"{name}: 轮数 {old['rounds']} -> {result['rounds']}")
+        for group in ('stages', 'modes'):
+            for key, seconds in result[group].items():
+                old_seconds = old[group].get(key)
+                if old_seconds and old_seconds >= NOISE_FLOOR and seconds > old_seconds * scenario_scale * tolerance:
+                    regressions.append(f"{name}: {key} {old_seconds * 1000:.1f}ms -> {seconds * 1000:.1f}ms")
+    return regressions
+
+def print_results(results, baseline, calibration=None):
+    header = f"{'scenario':<14}{'lines':>7}{'rounds':>7}" + "".join(f"{stage:>10}" for stage in STAGES) \
+        + "".join(f"{mode:>11}" for mode in af.ALIGN_MODES)
+    print(header)
+    print("-" * len(header))
+    for name, result in results.items():
+        # 达到最大迭代次数的场景标 *，输出不是正确对齐的结果
+        rounds = f"{result['rounds']}{'*' if result['rounds'] >= af.DEFAULT_MAX_ITERATIONS else ''}"
+        row = f"{name:<14}{result['lines']:>7}{rounds:>7}"
+        row += "".join(f"{result['stages'][stage] * 1000:>8.2f}ms" for stage in STAGES)
+        row += "".join(f"{result['modes'][mode] * 1000:>9.2f}ms" for mode in af.ALIGN_MODES)
+        print(row)
+        old = baseline.get('scenarios', {}).get(name)
+        if old:
+            ratio = sum(result['stages'].values()) / max(sum(old['stages'].values()), 1e-9)
+            print(f"{'':<14}相对基线: {ratio:.2f}x")
+    if any(result['rounds'] >= af.DEFAULT_MAX_ITERATIONS for result in results.values()):
+        print("* 达到最大迭代次数，输出仍有错位（只用于计时）")
+    if calibration and baseline.get('calibration'):
+        print(f"机器速度（calibrate 耗时）相对基线: {calibration / baseline['calibration']:.2f}x")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="align_flowchart 性能测试")
+    parser.add_argument("--repeat", type=int, default=5, help="每个场景重复次数，取最小值（默认: 5）")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="只运行指定场景，可重复指定（默认: 全部）")
+    parser.add_argument("--tolerance", type=float, default=1.5,
+                        help="耗时超过基线的多少倍视为回归（默认: 1.5）")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="基线文件（默认: benchmarks/baseline.json）")
+    parser.add_argument("--save-baseline", action="store_true", help="将本次结果保存为新的基线")
+    parser.add_argument("--retries", type=int, default=2,
+                        help="与基线对比有回归时，重新计时这些场景的最多次数（默认: 2，0 表示不复测）")
+    parser.add_argument("--update-golden", action="store_true", help="用当前实现重新生成 golden 输出")
+    parser.add_argument("--generate", metavar="SPEC",
+                        help="只输出一个合成流程图，如 boxes=50,depth=2,width=40,cjk=0.8,misaligned=5,seed=1")
+    parser.add_argument("--differential", type=int, default=20, metavar="CASES",
+                        help="差分测试的随机用例数量（默认: 20，0 表示跳过），完整选项见 difftest.py")
+    args = parser.parse_args(argv)
+
+    if args.generate is not None:
+        print(generate_flowchart(**parse_generator_spec(args.generate)))
+        return 0
+
+    failures = check_golden(update=args.update_golden)
+    if args.update_golden:
+        print(f"golden 输出已更新: {os.path.relpath(GOLDEN_DIR, os.getcwd())}")
+        return 0
+    for failure in failures:
+        print(f"GOLDEN: {failure}")
+
+    try:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    except (OSError, ValueError):
+        baseline = {}
+
+    calibration = calibrate()
+    results = {}
+    for name in args.scenario or SCENARIOS:
+        results[name] = run_scenario(generate_flowchart(**SCENARIOS[name]), args.repeat)
+    print_results(results, baseline, calibration)
+
+    # 差分测试在计时之后运行：它填满的各级缓存和分配的大量对象会拖慢随后的计时，造成虚假的回归
+    differential_diffs = 0
+    if args.differential > 0:
+        import difftest
+        print()
+        report = difftest.run_differential(args.differential)
+        difftest.print_report(report)
+        differential_diffs = sum(entry['diffs'] for entry in report.values())
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(dict(python=platform.python_version(), machine=platform.machine(),
+                           repeat=args.repeat, calibration=calibration, scenarios=results),
+                      f, indent=2, ensure_ascii=False)
+            f.write('\n')
+        print(f"基线已保存: {args.baseline}")
+        return 1 if failures or differential_diffs else 0
+
+    regressions = compare_baseline(results, baseline, args.tolerance, calibration)
+    # 机器负载的短时波动常使一次运行整体慢出 1.5 倍以上，calibrate() 也未必能反映出来；
+    # 有回归的场景重新计时，与上次的结果合并取最小值，复测后仍然变慢才算回归
+    for _ in range(args.retries):
+        names = [name for name in results if any(regression.startswith(f"{name}: ") for regression in regressions)]
+        if not names:
+            break
+        print(f"复测: {', '.join(names)}")
+        for name in names:
+            results[name] = merge_results(results[name], run_scenario(generate_flowchart(**SCENARIOS[name]),
+                                                                      args.repeat))
+        regressions = compare_baseline(results, baseline, args.tolerance, calibration)
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    return 1 if failures or regressions or differential_diffs else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,238 @@
+"""
+align_flowchart 差分测试
+
+以 reference.py 为参照（oracle）：它是 baseline 版本中原始算法的冻结副本，不依赖 align_flowchart 的任何代码，
+整篇文档每轮重新查找全部目标再执行一轮对齐，直到没有改动或达到最大迭代次数。随机生成大量错位的流程图
+（汉字、全角标点和字母、嵌套框、并排框、竖线前空格不够等边界情况），分别交给参照实现和各个优化后的
+实现（增量查找、NumPy 后端、流式处理、区域缓存、多进程），逐字节比较输出并给出加速比。
+
+solve 和 box 模式是不同的算法，没有参照实现；对所有模式检查一条性质：align_document 报告的
+unaligned_rows 必须与 check_document(结果, mode=...) 相同，即报告"已对齐"的文档确实通过检查。
+
+用法:
+    python benchmarks/difftest.py                          # 默认 200 个用例，比较所有可用的实现
+    python benchmarks/difftest.py --cases 1000 --seed 7    # 更多用例 / 换一组随机种子
+    python benchmarks/difftest.py --engine numpy --engine jobs
+    python benchmarks/difftest.py --dump failures/         # 将输出不一致的输入保存下来
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import align_flowchart as af  # noqa: E402
+from bench import generate_flowchart  # noqa: E402
+from reference import reference_align  # noqa: E402
+
+FULLWIDTH_CHARS = "，。：；！？（）【】《》“”ＡＢＣＸＹＺ１２３０"
+ROUNDED = str.maketrans("┌┐└┘", "╭╮╰╯")  # 参照实现不处理圆角框，这些行只需原样保留
+PROSE = "这一段是正文，不含框线字符。"
+
+
+# ---------------------------------------
+# 待比较的实现
+# ---------------------------------------
+def _stream_align(text, **options):
+    chunks = []
+    af.align_stream(io.StringIO(text), chunks.append, **options)
+    return "".join(chunks)
+
+def build_engines(names):
+    """
+    返回 {名称: align(text) 函数}
+    cache 在所有用例间共用同一个 MemoryRegionCache，可以发现不同区域的缓存键冲突
+    """
+    cache = af.MemoryRegionCache()
+    engines = dict(
+        iterative=lambda text: af.align_text(text, backend='python'),
+        numpy=lambda text: af.align_text(text, backend='numpy'),
+        stream=lambda text: _stream_align(text, backend='python'),
+        cache=lambda text: af.align_text(text, cache=cache),
+        jobs=lambda text: af.align_text(text, jobs=2),
+    )
+    return {name: engines[name] for name in names}
+
+ENGINES = ('iterative', 'numpy', 'stream', 'cache', 'jobs')
+# jobs 每个用例都要启动进程池，默认不运行
+DEFAULT_ENGINES = ('iterative', 'numpy', 'stream', 'cache')
+
+
+# ---------------------------------------
+# 随机用例
+# ---------------------------------------
+def _mutate_line(rng, line):
+    """在一行上制造一种边界情况"""
+    kind = rng.randrange(4)
+    if kind == 0:
+        # 全角标点、全角字母数字替换部分文字
+        chars = [rng.choice(FULLWIDTH_CHARS) if af.char_width(char) == 2 and rng.random() < 0.5 else char
+                 for char in line]
+        return "".join(chars)
+    pipe = line.rfind("│")
+    if pipe <= 0:
+        return line
+    if kind == 1:
+        # 竖线前没有空格可删：去掉右侧竖线前的所有空格
+        return line[:pipe].rstrip(" ") + line[pipe:]
+    if kind == 2:
+        # 竖线前多出几个空格
+        return line[:pipe] + " " * rng.randint(1, 3) + line[pipe:]
+    # 竖线前只剩一个空格
+    return line[:pipe].rstrip(" ") + " " + line[pipe:]
+
+def random_flowchart(seed):
+    """
+    按种子生成一个随机的错位流程图：随机的生成参数，再对部分行制造边界情况；
+    部分用例由两个流程图和中间的正文（或代码块围栏）组成，用于覆盖区域划分
+    """
+    rng = random.Random(seed)
+    parts = []
+    for _ in range(rng.choice((1, 1, 2))):
+        boxes = rng.randint(1, 12)
+        text = generate_flowchart(boxes=boxes, depth=rng.randint(1, 3), width=rng.randint(6, 50),
+                                  cjk_ratio=rng.random(), misaligned=rng.randint(0, boxes),
+                                  columns=rng.randint(1, 3), rows=rng.randint(1, 3), seed=rng.randrange(1 << 30))
+        lines = text.splitlines()
+        for row in rng.sample(range(len(lines)), min(len(lines), rng.randint(0, 6))):
+            lines[row] = _mutate_line(rng, lines[row])
+        if rng.random() < 0.2:
+            # 部分行改为圆角框
+            start = rng.randrange(len(lines))
+            for row in range(start, min(len(lines), start + rng.randint(1, 12))):
+                lines[row] = lines[row].translate(ROUNDED)
+        parts.append("\n".join(lines))
+    separator = [PROSE] * rng.randint(1, 14)
+    if rng.random() < 0.3:
+        separator[len(separator) // 2] = "```"
+    return ("\n" + "\n".join(separator) + "\n").join(parts)
+
+
+# ---------------------------------------
+# 运行
+# ---------------------------------------
+def _first_difference(expected, actual):
+    """返回第一处不同的 (行号, 参照行, 实际行)，行号从 1 开始"""
+    expected_lines = expected.split("\n")
+    actual_lines = actual.split("\n")
+    for row in range(max(len(expected_lines), len(actual_lines))):
+        left = expected_lines[row] if row < len(expected_lines) else None
+        right = actual_lines[row] if row < len(actual_lines) else None
+        if left != right:
+            return row + 1, left, right
+    return None
+
+def check_properties(text):
+    """
+    检查各模式下 align_document 报告的 unaligned_rows 与 check_document 对结果的检查一致
+    返回不满足的 [(模式, 报告的行号, 检查的行号), ...]
+    """
+    failures = []
+    for mode in af.ALIGN_MODES:
+        result, _, unaligned_rows = af.align_document(text, mode=mode)
+        checked = af.check_document(result, mode=mode)
+        if unaligned_rows != checked:
+            failures.append((mode, unaligned_rows, checked))
+    return failures
+
+def run_differential(cases=200, seed=0, engines=DEFAULT_ENGINES, properties=True, dump=None, out=None):
+    """
+    运行差分测试，返回 {实现: dict(cases, diffs, reference_seconds, seconds, speedup, failures)}
+    failures 为输出不一致的用例种子；properties 为 True 时另有 'properties' 项（见 check_properties），
+    其 failures 为 {模式: [种子, ...]}
+    """
+    out = out or sys.stdout
+    if 'numpy' in engines and af.load_numpy() is None:
+        print("未安装 NumPy，跳过 numpy", file=out)
+        engines = tuple(name for name in engines if name != 'numpy')
+    functions = build_engines(engines)
+    report = {name: dict(cases=0, diffs=0, reference_seconds=0.0, seconds=0.0, failures=[]) for name in functions}
+    property_failures = {mode: [] for mode in af.ALIGN_MODES}
+
+    for case_seed in range(seed, seed + cases):
+        text = random_flowchart(case_seed)
+        t = time.perf_counter()
+        expected = reference_align(text)
+        reference_seconds = time.perf_counter() - t
+        for name, align in functions.items():
+            t = time.perf_counter()
+            actual = align(text)
+            entry = report[name]
+            entry['seconds'] += time.perf_counter() - t
+            entry['reference_seconds'] += reference_seconds
+            entry['cases'] += 1
+            if actual == expected:
+                continue
+            entry['diffs'] += 1
+            entry['failures'].append(case_seed)
+            if entry['diffs'] == 1:
+                row, left, right = _first_difference(expected, actual)
+                print(f"DIFF {name} seed={case_seed} 第 {row} 行:\n  参照: {left!r}\n  实际: {right!r}", file=out)
+            if dump:
+                os.makedirs(dump, exist_ok=True)
+                with open(os.path.join(dump, f"seed{case_seed}.txt"), 'w', encoding='utf-8', newline='') as f:
+                    f.write(text)
+
+        if properties:
+            for mode, reported, checked in check_properties(text):
+                property_failures[mode].append(case_seed)
+                if len(property_failures[mode]) == 1:
+                    print(f"PROPERTY {mode} seed={case_seed}: unaligned_rows={reported[:10]} "
+                          f"check_document={checked[:10]}", file=out)
+
+    for entry in report.values():
+        entry['speedup'] = entry['reference_seconds'] / max(entry['seconds'], 1e-9)
+    if properties:
+        report['properties'] = dict(cases=cases, diffs=sum(map(len, property_failures.values())),
+                                    failures=property_failures)
+    return report
+
+def print_report(report, out=None):
+    out = out or sys.stdout
+    header = f"{'engine':<12}{'cases':>7}{'diffs':>7}{'reference':>12}{'engine':>12}{'speedup':>9}"
+    print(header, file=out)
+    print("-" * len(header), file=out)
+    for name, entry in report.items():
+        if name == 'properties':
+            continue
+        print(f"{name:<12}{entry['cases']:>7}{entry['diffs']:>7}{entry['reference_seconds'] * 1000:>10.1f}ms"
+              f"{entry['seconds'] * 1000:>10.1f}ms{entry['speedup']:>8.2f}x", file=out)
+        if entry['failures']:
+            shown = ", ".join(map(str, entry['failures'][:10]))
+            print(f"{'':<12}输出不一致的种子: {shown}{' ...' if len(entry['failures']) > 10 else ''}", file=out)
+    properties = report.get('properties')
+    if properties:
+        for mode, seeds in properties['failures'].items():
+            status = "ok" if not seeds else f"{len(seeds)} 个用例不一致，种子: {', '.join(map(str, seeds[:10]))}"
+            print(f"unaligned_rows == check_document ({mode}): {status}", file=out)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="align_flowchart 差分测试：对比优化后的实现与参照算法的输出")
+    parser.add_argument("--cases", type=int, default=200, help="随机用例数量（默认: 200）")
+    parser.add_argument("--seed", type=int, default=0, help="第一个用例的随机种子（默认: 0），用例种子依次递增")
+    parser.add_argument("--engine", action="append", choices=ENGINES,
+                        help="只比较指定的实现，可重复指定（默认: 除 jobs 外的全部）")
+    parser.add_argument("--no-properties", action="store_true",
+                        help="不检查 unaligned_rows 与 check_document 的一致性（只比较输出）")
+    parser.add_argument("--dump", metavar="DIR", help="将输出不一致的用例输入写入此目录（seed<N>.txt）")
+    parser.add_argument("--show", type=int, metavar="SEED", help="只输出指定种子的用例输入")
+    args = parser.parse_args(argv)
+
+    if args.show is not None:
+        print(random_flowchart(args.show))
+        return 0
+
+    report = run_differential(args.cases, args.seed, tuple(args.engine or DEFAULT_ENGINES),
+                              properties=not args.no_properties, dump=args.dump)
+    print_report(report)
+    return 1 if any(entry['diffs'] for entry in report.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
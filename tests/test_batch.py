@@ -0,0 +1,94 @@
+"""批量模式：collect_input_files、align_files 和原子写入"""
+import os
+
+import pytest
+
+import align_flowchart as af
+
+MISALIGNED = "┌────────┐\n│ 文字     │\n└────────┘\n"
+ALIGNED = "┌────────┐\n│ 文字   │\n└────────┘\n"
+
+
+def write(path, text):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write(text)
+
+
+def read(path):
+    with open(path, encoding='utf-8', newline='') as f:
+        return f.read()
+
+
+@pytest.fixture
+def tree(tmp_path):
+    (tmp_path / "docs").mkdir()
+    write(tmp_path / "docs" / "a.md", MISALIGNED)
+    write(tmp_path / "docs" / "b.txt", MISALIGNED)
+    write(tmp_path / "docs" / "c.py", MISALIGNED)
+    return tmp_path
+
+
+def test_collect_expands_directories_with_patterns(tree):
+    files = af.collect_input_files([str(tree / "docs")], patterns=("*.md", "*.txt"))
+    assert [os.path.basename(path) for path in files] == ["a.md", "b.txt"]
+
+
+def test_collect_deduplicates_on_realpath(tree, monkeypatch):
+    monkeypatch.chdir(tree)
+    os.symlink("docs/a.md", "link.md")
+    files = af.collect_input_files(["docs/a.md", "./docs/a.md", "docs", "link.md"], patterns=("*.md",))
+    # 同一个文件只保留第一次出现时的写法
+    assert files == ["docs/a.md"]
+
+
+def test_collect_keeps_missing_paths(tmp_path):
+    missing = str(tmp_path / "missing.txt")
+    assert af.collect_input_files([missing]) == [missing]
+
+
+def test_align_files_in_place(tree):
+    path = str(tree / "docs" / "a.md")
+    (summary,) = af.align_files([path], in_place=True)
+    assert summary['changed'] and summary['error'] is None
+    assert read(path) == ALIGNED
+
+
+def test_align_files_reports_errors(tmp_path):
+    (summary,) = af.align_files([str(tmp_path / "missing.txt")])
+    assert summary['error']
+
+
+def test_atomic_output_keeps_mtime_when_unchanged(tmp_path):
+    path = tmp_path / "same.txt"
+    write(path, "内容\n")
+    os.utime(path, (1, 1))
+    af.write_file_atomic(str(path), "内容\n")
+    assert os.stat(path).st_mtime == 1
+    assert read(path) == "内容\n"
+
+
+def test_atomic_output_preserves_mode_and_symlink(tmp_path):
+    target = tmp_path / "target.txt"
+    write(target, "old\n")
+    os.chmod(target, 0o640)
+    link = tmp_path / "link.txt"
+    os.symlink("target.txt", link)
+    af.write_file_atomic(str(link), "new\n")
+    assert os.path.islink(link)
+    assert read(target) == "new\n"
+    assert os.stat(target).st_mode & 0o777 == 0o640
+
+
+def test_atomic_output_leaves_file_on_error(tmp_path):
+    path = tmp_path / "keep.txt"
+    write(path, "old\n")
+    with pytest.raises(RuntimeError):
+        with af.atomic_output(str(path)) as f:
+            f.write("partial")
+            raise RuntimeError("boom")
+    assert read(path) == "old\n"
+    assert os.listdir(tmp_path) == ["keep.txt"]
+
+
+def test_atomic_output_writes_to_devices():
+    af.write_file_atomic(os.devnull, "discarded\n")
@@ -0,0 +1,98 @@
+"""区域结果缓存：RegionCache（磁盘）和 MemoryRegionCache（内存）"""
+import os
+
+import pytest
+
+import align_flowchart as af
+
+# 代码块围栏把文档分成两个互相独立的区域
+DOCUMENT = "┌────────┐\n│ 文字     │\n└────────┘\n```\n┌────┐\n│ ab   │\n└────┘"
+
+
+class CountingCache(af.MemoryRegionCache):
+    """记录命中和写入次数的内存缓存"""
+
+    def __init__(self):
+        super().__init__()
+        self.hits = 0
+        self.puts = 0
+
+    def get(self, key):
+        result = super().get(key)
+        self.hits += result is not None
+        return result
+
+    def put(self, key, result):
+        self.puts += 1
+        super().put(key, result)
+
+
+@pytest.fixture(params=['disk', 'memory'])
+def cache(request, tmp_path):
+    if request.param == 'disk':
+        return af.RegionCache(str(tmp_path / "cache"))
+    return af.MemoryRegionCache()
+
+
+def test_cached_result_matches_uncached(cache):
+    expected = af.align_document(DOCUMENT)
+    assert af.align_document(DOCUMENT, cache=cache) == expected
+    assert af.align_document(DOCUMENT, cache=cache) == expected
+
+
+def test_second_run_uses_cache_for_every_region():
+    cache = CountingCache()
+    af.align_document(DOCUMENT, cache=cache)
+    assert (cache.hits, cache.puts) == (0, 2)
+    af.align_document(DOCUMENT, cache=cache)
+    assert (cache.hits, cache.puts) == (2, 2)
+
+
+def test_only_changed_region_is_realigned():
+    cache = CountingCache()
+    af.align_document(DOCUMENT, cache=cache)
+    af.align_document(DOCUMENT.replace("ab", "cd"), cache=cache)
+    assert (cache.hits, cache.puts) == (1, 3)
+
+
+def test_key_depends_on_options(cache):
+    lines = DOCUMENT.split("\n")[:3]
+    options = dict(mode='iterative', row_range=af.DEFAULT_ROW_RANGE, col_range=af.DEFAULT_COL_RANGE,
+                   corner_row_range=af.DEFAULT_CORNER_ROW_RANGE, corner_col_range=af.DEFAULT_CORNER_COL_RANGE,
+                   max_iterations=af.DEFAULT_MAX_ITERATIONS, extended_glyphs=False)
+    key = cache.key(lines, options)
+    assert cache.key(list(lines), dict(options)) == key
+    assert cache.key(lines, dict(options, mode='box')) != key
+    assert cache.key(lines, dict(options, extended_glyphs=True)) != key
+    assert cache.key(lines[:2], options) != key
+
+
+def test_disk_cache_ignores_corrupt_entries(tmp_path):
+    cache = af.RegionCache(str(tmp_path))
+    key = "ab" + "0" * 62
+    cache.put(key, (["a", "b"], 1, [0]))
+    assert cache.get(key) == (["a", "b"], 1, [0])
+    with open(cache._path(key), 'w', encoding='utf-8') as f:
+        f.write("{not json")
+    assert cache.get(key) is None
+
+
+def test_disk_cache_prune_removes_least_recently_used(tmp_path):
+    cache = af.RegionCache(str(tmp_path), max_bytes=0)
+    keys = [f"{i:02d}" + "0" * 62 for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.put(key, ([str(i)], 1, []))
+        os.utime(cache._path(key), (i, i))
+    size = os.path.getsize(cache._path(keys[0]))
+    cache.max_bytes = 2 * size
+    assert cache.prune() == 1
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[2]) is not None
+
+
+def test_memory_cache_evicts_oldest_entry():
+    cache = af.MemoryRegionCache(max_entries=2)
+    for key in ("a", "b", "c"):
+        cache.put(key, ([key], 1, []))
+    assert cache.get("a") is None
+    assert cache.get("c") == (["c"], 1, [])
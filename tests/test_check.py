@@ -0,0 +1,77 @@
+"""--check 和已对齐文档的快速路径，以及 -o 写回时保留文件末尾的换行"""
+import os
+
+import align_flowchart as af
+
+MISALIGNED = "┌────────┐\n│ 文字     │\n└────────┘\n"
+ALIGNED = "┌────────┐\n│ 文字   │\n└────────┘\n"
+
+
+def write(path, text):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write(text)
+
+
+def read(path):
+    with open(path, encoding='utf-8', newline='') as f:
+        return f.read()
+
+
+def test_check_document_reports_misaligned_rows():
+    assert af.check_document(MISALIGNED) == [1]
+    assert af.check_document(ALIGNED) == []
+
+
+def test_aligned_document_runs_no_round():
+    assert af.align_document(ALIGNED) == (ALIGNED.rstrip("\n"), 0, [])
+
+
+def test_check_file_data_matches_check_document():
+    data = ("正文\n" * 50 + MISALIGNED + "正文\n" * 50).encode('utf-8')
+    assert af.check_file_data(data) == [51]
+
+
+def test_has_box_markers():
+    assert af.has_box_markers("│")
+    assert af.has_box_markers("┐".encode('utf-8'))
+    assert not af.has_box_markers("只有正文".encode('utf-8'))
+
+
+def test_cli_check_exit_status(tmp_path, capsys):
+    path = tmp_path / "doc.md"
+    write(path, MISALIGNED)
+    assert af.main(["-i", str(path), "--check"]) == 1
+    assert "2" in capsys.readouterr().out
+    write(path, ALIGNED)
+    assert af.main(["-i", str(path), "--check"]) == 0
+    assert read(path) == ALIGNED
+
+
+def test_cli_batch_check_does_not_write(tmp_path, capsys):
+    path = tmp_path / "doc.md"
+    write(path, MISALIGNED)
+    assert af.main([str(tmp_path), "--check"]) == 1
+    assert read(path) == MISALIGNED
+
+
+def test_output_to_input_keeps_trailing_newline(tmp_path):
+    path = tmp_path / "doc.md"
+    write(path, MISALIGNED)
+    assert af.main(["-i", str(path), "-o", str(path)]) == 0
+    assert read(path) == ALIGNED
+
+
+def test_output_of_aligned_file_is_not_rewritten(tmp_path):
+    path = tmp_path / "doc.md"
+    write(path, ALIGNED)
+    os.utime(path, (1, 1))
+    assert af.main(["-i", str(path), "-o", str(path)]) == 0
+    assert read(path) == ALIGNED
+    assert os.stat(path).st_mtime == 1
+
+
+def test_output_without_trailing_newline(tmp_path):
+    path = tmp_path / "doc.md"
+    write(path, MISALIGNED.rstrip("\n"))
+    assert af.main(["-i", str(path), "-o", str(path)]) == 0
+    assert read(path) == ALIGNED.rstrip("\n")
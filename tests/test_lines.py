@@ -0,0 +1,90 @@
+"""--lines：行范围的解析，以及只对齐/检查与之相交的区域"""
+import json
+
+import pytest
+
+import align_flowchart as af
+
+MISALIGNED = "┌────────┐\n│ 文字     │\n└────────┘\n"
+ALIGNED = "┌────────┐\n│ 文字   │\n└────────┘\n"
+# 两个区域（第 1-3 行和第 5-7 行）由代码块围栏隔开
+DOCUMENT = MISALIGNED + "```\n" + MISALIGNED
+
+
+def write(path, text):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write(text)
+
+def read(path):
+    with open(path, encoding='utf-8', newline='') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('spec, expected', [
+    ('3', (2, 3)),
+    ('2:5', (1, 5)),
+    ('4:4', (3, 4)),
+    ('5:', (4, None)),
+    (':5', (0, 5)),
+    (':', (0, None)),
+])
+def test_parse_line_range(spec, expected):
+    assert af.parse_line_range(spec) == expected
+
+
+@pytest.mark.parametrize('spec', ['', 'a', '0', '0:3', '5:2', '-1', '1:x', '1:2:3', '1.5'])
+def test_parse_line_range_rejects_invalid(spec):
+    with pytest.raises(ValueError):
+        af.parse_line_range(spec)
+
+
+@pytest.mark.parametrize('spec', ['', '0', '5:2', 'x'])
+def test_cli_rejects_invalid_range(tmp_path, capsys, spec):
+    source = tmp_path / "in.md"
+    write(source, DOCUMENT)
+    with pytest.raises(SystemExit) as exc:
+        af.main(['--input', str(source), '--lines', spec])
+    assert exc.value.code == 2
+    assert "无效的行范围" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize('spec, expected', [
+    ('1:3', ALIGNED + "```\n" + MISALIGNED),
+    ('2', ALIGNED + "```\n" + MISALIGNED),
+    ('6:', MISALIGNED + "```\n" + ALIGNED),
+    (':7', ALIGNED + "```\n" + ALIGNED),
+    ('4', DOCUMENT),
+])
+def test_only_intersecting_regions_are_aligned(tmp_path, spec, expected):
+    source, target = tmp_path / "in.md", tmp_path / "out.md"
+    write(source, DOCUMENT)
+    assert af.main(['--input', str(source), '-o', str(target), '--lines', spec]) == 0
+    assert read(target) == expected
+
+
+def test_edits_and_diff_cover_only_the_range(tmp_path, capsys):
+    source = tmp_path / "in.md"
+    write(source, DOCUMENT)
+    assert af.main(['--input', str(source), '--lines', '5:', '--output-format', 'edits']) == 0
+    assert json.loads(capsys.readouterr().out) == [dict(start=5, end=6, lines=["│ 文字   │"])]
+    assert af.main(['--input', str(source), '--lines', '5:', '--output-format', 'diff']) == 0
+    diff = capsys.readouterr().out
+    assert "@@ -3,5 +3,5 @@" in diff
+    assert diff.count("\n-│") == 1 and "\n+│ 文字   │\n" in diff
+
+
+def test_check_honours_range(tmp_path, capsys):
+    source = tmp_path / "in.md"
+    write(source, ALIGNED + "```\n" + MISALIGNED)
+    assert af.main(['--input', str(source), '--check', '--lines', '1:3']) == 0
+    assert af.main(['--input', str(source), '--check', '--lines', '3:']) == 1
+    assert "未对齐的行: 6" in capsys.readouterr().out
+
+
+def test_rejected_with_batch_and_stream(tmp_path):
+    source = tmp_path / "in.md"
+    write(source, DOCUMENT)
+    with pytest.raises(SystemExit):
+        af.main([str(source), '--lines', '1:3'])
+    with pytest.raises(SystemExit):
+        af.main(['--input', str(source), '--stream', '--lines', '1:3'])
@@ -0,0 +1,136 @@
+"""常驻服务：AlignServer 的 JSON-RPC 请求处理和 serve_socket"""
+import io
+import json
+import socket
+import threading
+
+import pytest
+
+import align_flowchart as af
+
+MISALIGNED = "┌────────┐\n│ 文字     │\n└────────┘\n"
+ALIGNED = "┌────────┐\n│ 文字   │\n└────────┘\n"
+
+
+def call(server, method, params=None, request_id=1):
+    request = dict(jsonrpc='2.0', id=request_id, method=method)
+    if params is not None:
+        request['params'] = params
+    response = server.handle_line(json.dumps(request))
+    return None if response is None else json.loads(response)
+
+
+def test_align_and_check():
+    server = af.AlignServer()
+    result = call(server, 'align', dict(text=MISALIGNED, edits=True))['result']
+    assert result['text'] == ALIGNED and result['changed']
+    assert result['edits'] == [dict(start=1, end=2, lines=["│ 文字   │"])]
+    assert call(server, 'check', dict(text=MISALIGNED))['result'] == dict(misaligned_rows=[1])
+
+
+def test_options_are_passed_through():
+    server = af.AlignServer()
+    for options in (dict(mode='box'), dict(backend='python'), dict(extended_glyphs=True)):
+        assert call(server, 'align', dict(text=MISALIGNED, **options))['result']['text'] == ALIGNED
+
+
+def test_document_lifecycle():
+    server = af.AlignServer()
+    assert call(server, 'open', dict(uri='a.md', text=MISALIGNED)) == dict(jsonrpc='2.0', id=1, result=None)
+    call(server, 'change', dict(uri='a.md', edits=[dict(start=0, end=0, lines=["标题"])]))
+    result = call(server, 'format', dict(uri='a.md'))['result']
+    assert result['text'] == "标题\n" + ALIGNED
+    assert server.documents['a.md'] == "标题\n" + ALIGNED
+    call(server, 'close', dict(uri='a.md'))
+    assert call(server, 'format', dict(uri='a.md'))['error']['code'] == -32602
+
+
+def test_notification_gets_no_response():
+    server = af.AlignServer()
+    assert server.handle_line(json.dumps(dict(jsonrpc='2.0', method='open', params=dict(uri='a', text='')))) is None
+    assert 'a' in server.documents
+
+
+@pytest.mark.parametrize('line, code', [
+    ('{not json', -32700),
+    ('[]', -32600),
+    ('[{"jsonrpc": "2.0", "id": 1, "method": "align", "params": {"text": ""}}]', -32600),
+    ('{"jsonrpc": "2.0", "id": 1}', -32600),
+    ('{"jsonrpc": "2.0", "id": 1, "method": "nope"}', -32601),
+    ('{"jsonrpc": "2.0", "id": 1, "method": "align", "params": []}', -32602),
+])
+def test_invalid_requests(line, code):
+    response = json.loads(af.AlignServer().handle_line(line))
+    assert response['error']['code'] == code
+    if code in (-32700, -32600):
+        assert response['id'] is None
+
+
+@pytest.mark.parametrize('params', [
+    dict(text="x"),
+    dict(uri=None, text="x"),
+    dict(uri="a", text=None),
+])
+def test_open_requires_uri_and_text(params):
+    server = af.AlignServer()
+    assert call(server, 'open', params)['error']['code'] == -32602
+    assert server.documents == {}
+
+
+@pytest.mark.parametrize('edit', [
+    dict(start=0, end=1, lines="abc"),
+    dict(start=0, end=1, lines=[1, 2]),
+    dict(start=0, end=1),
+    dict(start=1, end=0, lines=[]),
+    "0:1",
+])
+def test_change_rejects_invalid_edits(edit):
+    server = af.AlignServer()
+    call(server, 'open', dict(uri='a', text=MISALIGNED))
+    assert call(server, 'change', dict(uri='a', edits=[edit]))['error']['code'] == -32602
+    assert server.documents['a'] == MISALIGNED
+
+
+def test_serve_stops_on_shutdown():
+    requests = [dict(jsonrpc='2.0', id=1, method='shutdown'), dict(jsonrpc='2.0', id=2, method='align')]
+    out = io.StringIO()
+    af.AlignServer().serve(io.StringIO("".join(json.dumps(r) + "\n" for r in requests)), out)
+    assert [json.loads(line)['id'] for line in out.getvalue().splitlines()] == [1]
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _connect(port):
+    for _ in range(100):
+        try:
+            return socket.create_connection(('127.0.0.1', port), timeout=5)
+        except ConnectionRefusedError:
+            threading.Event().wait(0.05)
+    raise AssertionError("服务没有启动")
+
+
+def _rpc(sock, request):
+    sock.sendall((json.dumps(request) + "\n").encode('utf-8'))
+    reply = b""
+    while not reply.endswith(b"\n"):
+        reply += sock.recv(65536)
+    return json.loads(reply)
+
+
+def test_socket_connections_are_served_concurrently():
+    port = _free_port()
+    server = af.AlignServer()
+    thread = threading.Thread(target=af.serve_socket, args=(server, '127.0.0.1', port), daemon=True)
+    thread.start()
+    idle = _connect(port)  # 保持空闲的连接不能阻塞其他连接
+    with _connect(port) as active:
+        request = dict(jsonrpc='2.0', id=1, method='align', params=dict(text=MISALIGNED))
+        assert _rpc(active, request)['result']['text'] == ALIGNED
+        assert _rpc(active, dict(jsonrpc='2.0', id=2, method='shutdown'))['id'] == 2
+    thread.join(timeout=5)
+    idle.close()
+    assert not thread.is_alive()
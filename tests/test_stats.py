@@ -0,0 +1,70 @@
+"""--stats：统计中的 changed、迭代轮数和命中缓存的区域"""
+import json
+
+import pytest
+
+import align_flowchart as af
+
+MISALIGNED = "┌────────┐\n│ 文字     │\n└────────┘\n"
+ALIGNED = "┌────────┐\n│ 文字   │\n└────────┘\n"
+
+
+def write(path, text):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write(text)
+
+def run_stats(tmp_path, text, *extra):
+    source, stats_path = tmp_path / "in.md", tmp_path / "stats.json"
+    write(source, text)
+    assert af.main(['--input', str(source), '--stats', str(stats_path), *extra]) == 0
+    with open(stats_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize('text', [ALIGNED, ALIGNED.rstrip('\n'), "正文\n", ""])
+@pytest.mark.parametrize('extra', [(), ('--output-format', 'edits')])
+def test_unchanged_input(tmp_path, capsys, text, extra):
+    report = run_stats(tmp_path, text, *extra)
+    assert report['changed'] is False
+    assert report['unaligned_rows'] == 0
+
+
+@pytest.mark.parametrize('text', [MISALIGNED, MISALIGNED.rstrip('\n')])
+def test_changed_input(tmp_path, capsys, text):
+    report = run_stats(tmp_path, text)
+    assert report['changed'] is True
+    assert report['rounds'] >= 1
+    assert capsys.readouterr().out == ALIGNED
+
+
+def test_unchanged_output_file(tmp_path):
+    target = tmp_path / "out.md"
+    assert run_stats(tmp_path, ALIGNED, '-o', str(target))['changed'] is False
+
+
+def test_cached_regions_keep_rounds():
+    cache = af.MemoryRegionCache()
+    text = MISALIGNED + "```\n" + MISALIGNED
+    first = af.AlignStats()
+    expected, _, _ = af.align_document(text, cache=cache, stats=first)
+    assert first.regions == 2 and first.cached_regions == 0 and first.rounds >= 1
+
+    second = af.AlignStats()
+    result, _, _ = af.align_document(text, cache=cache, stats=second)
+    assert result == expected
+    assert second.regions == 2 and second.cached_regions == 2
+    assert second.rounds == first.rounds
+    assert second.round_seconds == [] and second.spaces_removed == 0
+
+
+def test_cached_region_reports_max_iterations_hit():
+    # 需要多轮才能对齐：竖线和 "┘" 都偏右
+    text = "┌──────────────┐\n│ 文字文字文字     │\n└────────────────┘\n"
+    cache = af.MemoryRegionCache()
+    reports = []
+    for _ in range(2):
+        stats = af.AlignStats()
+        _, _, unaligned_rows = af.align_document(text, cache=cache, stats=stats, max_iterations=1)
+        assert unaligned_rows
+        reports.append((stats.cached_regions, stats.rounds, stats.max_iterations_hit))
+    assert reports == [(0, 1, True), (1, 1, True)]